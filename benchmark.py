@@ -0,0 +1,206 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+import chess
+
+from run_bot import MiniMaxBot, PieceValueBot
+from your_bot_file import ChessBot, encodeMove
+
+
+# (name, fen, depth, expected node count). The counts are the published
+# perft results for these positions.
+PERFT_POSITIONS = [
+    ("start", chess.STARTING_FEN, 4, 197281),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3, 97862),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 5, 674624),
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 9467),
+    ("discovered", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 3, 62379),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 3, 89890),
+]
+
+# (name, fen) positions the search is timed on
+SEARCH_POSITIONS = [
+    ("start", chess.STARTING_FEN),
+    ("italian", "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+    ("middlegame", "r4rk1/2p2pp1/2p4p/p3q2b/1p2P3/P6P/1PP1NPP1/R2Q1RK1 w - - 1 17"),
+    ("tactics", "r1b1k2r/ppppnppp/2n2q2/2b5/3NP3/2P1B3/PP3PPP/RN1QKB1R w KQkq - 0 1"),
+    ("endgame", "8/5pk1/6p1/8/3R4/6P1/5PK1/3r4 w - - 0 40"),
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def best_time(function, repeat):
+    # The fastest run is the one least disturbed by the rest of the machine
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def perft(position, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in position.generateMoves():
+        if position.makeMove(move):
+            nodes += perft(position, depth - 1)
+            position.unmakeMove()
+    return nodes
+
+
+def run_perft(bot, depth_offset=0):
+    results = []
+    for name, fen, depth, expected in PERFT_POSITIONS:
+        depth = max(1, depth + depth_offset)
+        bot.position.setBoard(chess.Board(fen))
+        start = time.perf_counter()
+        nodes = perft(bot.position, depth)
+        seconds = time.perf_counter() - start
+        results.append({
+            "name": name,
+            "depth": depth,
+            "nodes": nodes,
+            # Only the listed depth has a published count
+            "correct": nodes == expected if depth_offset == 0 else None,
+            "seconds": seconds,
+            "nps": nodes / seconds,
+        })
+    return results
+
+
+def run_search(max_depth):
+    results = []
+    for name, fen in SEARCH_POSITIONS:
+        # Iterative deepening in ChessBot starts at depth 2
+        for depth in range(2, max_depth + 1):
+            # A fresh bot per depth, so no depth profits from the table of another
+            bot = ChessBot(maxDepth=depth)
+            start = time.perf_counter()
+            move = bot(fen)
+            seconds = time.perf_counter() - start
+            results.append({
+                "name": name,
+                "depth": depth,
+                "nodes": bot.nodes,
+                "seconds": seconds,
+                "nps": bot.nodes / seconds,
+                "move": move.uci(),
+            })
+            bot.close()
+    return results
+
+
+def run_micro(bot, repeat, count=2000):
+    # Every benchmark runs count operations on the positions of the search
+    # set, the result is in operations per second
+    positions = []
+    for _, fen in SEARCH_POSITIONS:
+        board = chess.Board(fen)
+        moves = [encodeMove(move) for move in board.legal_moves]
+        positions.append((board, moves))
+    position = bot.position
+    results = {}
+
+    def each_position(operation):
+        def run():
+            for board, moves in positions:
+                position.setBoard(board)
+                operation(moves)
+        return run
+
+    def make_unmake(moves):
+        for _ in range(count // len(moves) + 1):
+            for move in moves:
+                if position.makeMove(move):
+                    position.unmakeMove()
+
+    def compute_hash(moves):
+        for _ in range(count):
+            bot.getZobristHash()
+
+    def evaluate(moves):
+        for _ in range(count):
+            bot.evaluate()
+
+    def move_value(moves):
+        for _ in range(count // len(moves) + 1):
+            for move in moves:
+                bot.moveValue(move)
+
+    def generate_moves(moves):
+        for _ in range(count // len(moves) + 1):
+            position.generateMoves()
+
+    benchmarks = {
+        # Incremental hash and evaluation updates against recomputing the hash
+        "make_unmake": (make_unmake, sum(len(moves) * (count // len(moves) + 1) for _, moves in positions)),
+        "compute_hash": (compute_hash, count * len(positions)),
+        "evaluate": (evaluate, count * len(positions)),
+        "move_value": (move_value, sum(len(moves) * (count // len(moves) + 1) for _, moves in positions)),
+        "generate_moves": (generate_moves, sum(count // len(moves) + 1 for _, moves in positions)),
+    }
+    for name, (operation, operations) in benchmarks.items():
+        seconds = best_time(each_position(operation), repeat)
+        results[name] = {"operations": operations, "seconds": seconds, "ops": operations / seconds}
+    return results
+
+
+def run_baselines(depth, repeat):
+    results = []
+    for bot_class in (MiniMaxBot, PieceValueBot):
+        for reference in (False, True):
+            bot = bot_class(depth, reference=reference)
+            for name, fen in SEARCH_POSITIONS:
+                seconds = best_time(lambda: bot(fen), repeat)
+                results.append({"bot": bot_class.__name__, "reference": reference, "name": name, "depth": depth,
+                                "seconds": seconds})
+    return results
+
+
+def run_benchmarks(search_depth=4, perft_offset=0, baseline_depth=1, repeat=3):
+    bot = ChessBot(hashSizeMB=1)
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "perft": run_perft(bot, perft_offset),
+        "search": run_search(search_depth),
+        "micro": run_micro(bot, repeat),
+        "baselines": run_baselines(baseline_depth, repeat),
+    }
+    bot.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark move generation, search and evaluation of the bots.")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--depth", type=int, default=4, help="deepest ChessBot search to time")
+    parser.add_argument("--perft-offset", type=int, default=0,
+                        help="added to every perft depth, e.g. -1 for a quick run without verification")
+    parser.add_argument("--baseline-depth", type=int, default=1, help="search depth of the run_bot.py baselines")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per micro-benchmark, the fastest counts")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.depth, arguments.perft_offset, arguments.baseline_depth, arguments.repeat)
+    failed = [entry["name"] for entry in results["perft"] if entry["correct"] is False]
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if failed:
+        raise SystemExit(f"Perft mismatch in {', '.join(failed)}")
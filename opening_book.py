@@ -0,0 +1,68 @@
+import argparse
+from collections import defaultdict
+
+import chess
+import chess.pgn
+
+from your_bot_file import ChessBot, OpeningBook, ZOBRIST_SEED, encodeMove
+
+
+# Weight a move gets for the side that played it, by game result
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+def add_pgn(bot, entries, path, max_plies):
+    with open(path) as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            white_points, black_points = RESULT_POINTS.get(game.headers.get("Result"), (1, 1))
+            board = game.board()
+            bot.position.setBoard(board)
+            for ply, move in enumerate(game.mainline_moves()):
+                if ply >= max_plies:
+                    break
+                weight = white_points if board.turn == chess.WHITE else black_points
+                if weight:
+                    entries[(bot.position.hash, encodeMove(move))] += weight
+                bot.position.makeMove(encodeMove(move))
+                board.push(move)
+
+
+def add_epd(bot, entries, path):
+    with open(path) as epd:
+        for line in epd:
+            if not line.strip():
+                continue
+            board, operations = chess.Board.from_epd(line)
+            bot.position.setBoard(board)
+            for move in operations.get("bm", []):
+                entries[(bot.position.hash, encodeMove(move))] += 1
+
+
+def build_book(paths, output, max_plies=20, min_weight=1, seed=ZOBRIST_SEED):
+    # Only the bot's hashing is needed, so keep its search table tiny
+    bot = ChessBot(hashSizeMB=1, zobristSeed=seed)
+    entries = defaultdict(int)
+    for path in paths:
+        if path.endswith(".epd"):
+            add_epd(bot, entries, path)
+        else:
+            add_pgn(bot, entries, path, max_plies)
+    entries = {key: weight for key, weight in entries.items() if weight >= min_weight}
+    OpeningBook.write(output, entries, seed)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a ChessBot opening book from PGN and EPD files.")
+    parser.add_argument("paths", nargs="+", help="PGN files, or EPD files with bm operations")
+    parser.add_argument("-o", "--output", default="book.bin")
+    parser.add_argument("--plies", type=int, default=20, help="number of half moves to take from every game")
+    parser.add_argument("--min-weight", type=int, default=1, help="drop moves with a lower total weight")
+    parser.add_argument("--seed", type=int, default=ZOBRIST_SEED, help="Zobrist seed of the bots using the book")
+    arguments = parser.parse_args()
+
+    count = build_book(arguments.paths, arguments.output, arguments.plies, arguments.min_weight, arguments.seed)
+    print(f"Wrote {count} book moves to {arguments.output}")
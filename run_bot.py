@@ -1,11 +1,13 @@
-from your_bot_file import ChessBotClass, ChessBot
+from your_bot_file import ChessBotClass, IncrementalBotClass, ChessBot, Clock, Position, \
+    decodeMove, zobristKeys
 from itertools import count
+import queue
+import shlex
+import subprocess
+import threading
 import time
-import numpy as np
-import pandas as pd
 import chess
 import random
-from IPython.display import clear_output, display
 
 
 class RandomBot(ChessBotClass):
@@ -45,10 +47,108 @@ class HumanPlayer(ChessBotClass):
 
 
 INF = 1e10
+# Mate scores of the fast search, with the depth left added so quicker mates
+# score higher
+MATE = 1e6
+NO_TABLES = (0,) * (16 * 64)
+
+
+def create_position(material_values):
+    # A Position like ChessBot's, but without piece-square tables
+    piece_keys, side_key, castling_keys, en_passant_keys = zobristKeys()
+    return Position(piece_keys, side_key, castling_keys, en_passant_keys, material_values,
+                    NO_TABLES, NO_TABLES)
+
+
+class Evaluator():
+    # Static evaluation of the fast baseline search. The material of
+    # piece_values is summed up incrementally by Position while moves are
+    # made, evaluate gives the score from the side to move's point of view.
+    def __init__(self, piece_values=None):
+        self.piece_values = piece_values or {}
+
+    def material_values(self):
+        # Indexed by piece code, color * 8 + piece type, white counts positive
+        values = [0] * 16
+        for piece_type, value in self.piece_values.items():
+            values[8 + piece_type] = value
+            values[piece_type] = -value
+        return values
+
+    def evaluate(self, position):
+        return position.material if position.turn else -position.material
+
+
+class AlphaBetaSearch():
+    # Fixed depth negamax with alpha-beta pruning on the make/unmake
+    # Position of your_bot_file, shared by the baseline bots
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.position = create_position(evaluator.material_values())
+
+    def best_move(self, board, depth):
+        # depth counts the plies after the root move, like MiniMaxBot's max_depth
+        position = self.position
+        position.setBoard(board)
+        best_move = 0
+        best_value = -INF
+        for move in position.generateMoves():
+            if not position.makeMove(move):
+                continue
+            value = -self.negamax(depth, -INF, -best_value)
+            position.unmakeMove()
+            if value > best_value or not best_move:
+                best_value = value
+                best_move = move
+        return decodeMove(best_move)
+
+    def negamax(self, depth, alpha, beta):
+        position = self.position
+        if position.isDraw():
+            return 0
+        if depth == 0:
+            return self.evaluator.evaluate(position)
+        best_value = -INF
+        for move in position.generateMoves():
+            if not position.makeMove(move):
+                continue
+            value = -self.negamax(depth - 1, -beta, -alpha)
+            position.unmakeMove()
+            if value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if value >= beta:
+                        break
+        if best_value == -INF:
+            # No legal move
+            return -MATE - depth if position.inCheck() else 0
+        return best_value
+
 
 class MiniMaxBot(ChessBotClass):
-    def __init__(self, max_depth: int) -> None:
+    # By default the bot searches with AlphaBetaSearch. reference=True
+    # plays exactly like the original python-chess minimax below, which
+    # is a lot slower and keeps its quirks.
+    def __init__(self, max_depth: int, reference: bool = False) -> None:
         self._max_depth = max_depth
+        # The fast search only knows the evaluation through create_evaluator,
+        # so subclasses that only override evaluate_board (like NumPieceBot
+        # in the notebook) play the reference way
+        self.reference = reference or not self.has_evaluator()
+        self.search = None
+
+    def has_evaluator(self):
+        # True when the nearest override of the evaluation is create_evaluator
+        for cls in type(self).__mro__:
+            if "create_evaluator" in vars(cls):
+                return True
+            if "evaluate_board" in vars(cls):
+                return False
+        return True
+
+    def create_evaluator(self):
+        return Evaluator()
 
     def evaluate_board(self, board, turn):
         return 0
@@ -59,6 +159,8 @@ class MiniMaxBot(ChessBotClass):
                 maximizing: bool) -> float:
 
         if depth == 0 or board.is_game_over():
+            # -1**x is -(1**x), so every leaf is negated no matter whose turn
+            # it is. Kept as it is, this is the reference behaviour.
             return self.evaluate_board(board, board.turn) * -1**(not maximizing)
         if maximizing:
             value = -INF
@@ -86,6 +188,10 @@ class MiniMaxBot(ChessBotClass):
 
     def __call__(self, board_fen: str) -> chess.Move:
         board = chess.Board(board_fen)
+        if not self.reference:
+            if self.search is None:
+                self.search = AlphaBetaSearch(self.create_evaluator())
+            return self.search.best_move(board, self._max_depth)
 
         best_move = None
         best_eval = -INF
@@ -104,71 +210,290 @@ DEFAULT_PIECE_VALUES = {chess.PAWN : 1, chess.ROOK : 5, chess.KNIGHT : 3, chess.
 class PieceValueBot(MiniMaxBot):
     def __init__(self,
             max_depth: int,
-            piece_values: dict = DEFAULT_PIECE_VALUES
+            piece_values: dict = DEFAULT_PIECE_VALUES,
+            reference: bool = False
         ) -> None:
-        super().__init__(max_depth)
+        super().__init__(max_depth, reference)
         self.piece_values = piece_values
 
+    def create_evaluator(self):
+        # The fast search scores own minus opponent material, the reference
+        # evaluate_board below only counts the side to move's pieces
+        return Evaluator(self.piece_values)
+
     def evaluate_board(self, board: chess.Board, color: chess.Color) -> float:
         return sum([self.piece_values[piece.piece_type] for piece in board.piece_map().values() if piece.color == color])
 
 
+class UciPlayer(IncrementalBotClass):
+    # Plays through an external UCI engine process, e.g.
+    # UciPlayer("python uci.py --bot piecevalue") or any other engine binary.
+    # An engine that does not answer before its clock runs out (plus
+    # grace_time for the pipes) is killed and restarted for the next game.
+    uses_clock = True
+    grace_time = 1.0
+    # Sent when there is no clock to pass on
+    default_go = "go movetime 1000"
+
+    def __init__(self, command, options=None):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.options = options or {}
+        self.process = None
+        self.lines = None
+        self.board = chess.Board()
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, bufsize=1)
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read_lines, args=(self.process.stdout, self.lines), daemon=True).start()
+        self.send("uci")
+        if self.wait_for("uciok", time.perf_counter() + 10) is None:
+            self.kill()
+            return
+        for name, value in self.options.items():
+            self.send(f"setoption name {name} value {value}")
+
+    @staticmethod
+    def read_lines(stream, lines):
+        for line in stream:
+            lines.put(line.strip())
+        # The engine exited
+        lines.put(None)
+
+    def send(self, line):
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            pass
+
+    def wait_for(self, prefix, deadline):
+        # Returns the first line starting with prefix, or None when the engine
+        # exited or missed the deadline
+        while True:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                return None
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if line is None:
+                return None
+            if line.startswith(prefix):
+                return line
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def close(self):
+        if self.process is not None:
+            self.send("quit")
+            try:
+                self.process.wait(1)
+            except subprocess.TimeoutExpired:
+                pass
+            self.kill()
+
+    def new_game(self, board_fen=None):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        self.board = chess.Board(board_fen) if board_fen else chess.Board()
+        if self.process is not None:
+            self.send("ucinewgame")
+            self.send("isready")
+            if self.wait_for("readyok", time.perf_counter() + 10) is None:
+                self.kill()
+
+    def push_move(self, move):
+        self.board.push(move)
+
+    def __call__(self, board_fen, clock=None):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        self.board = chess.Board(board_fen)
+        return self.go(clock)
+
+    def go(self, clock=None):
+        if self.process is None:
+            return None
+        root = self.board.root()
+        moves = " ".join(move.uci() for move in self.board.move_stack)
+        self.send(f"position fen {root.fen()}" + (f" moves {moves}" if moves else ""))
+        if clock is None:
+            self.send(self.default_go)
+            deadline = time.perf_counter() + 10
+        else:
+            remaining = max(0, round(clock.remaining * 1000))
+            increment = round(clock.increment * 1000)
+            # Only the own clock is known, the engine sees it for both sides
+            command = f"go wtime {remaining} btime {remaining} winc {increment} binc {increment}"
+            if clock.movesToGo:
+                command += f" movestogo {clock.movesToGo}"
+            self.send(command)
+            deadline = time.perf_counter() + clock.remaining + self.grace_time
+
+        line = self.wait_for("bestmove", deadline)
+        if line is None:
+            self.kill()
+            return None
+        tokens = line.split()
+        if len(tokens) < 2 or tokens[1] in ("(none)", "0000"):
+            return None
+        move = chess.Move.from_uci(tokens[1])
+        self.board.push(move)
+        return move
+
+
 class Judge():
-    def __init__(self, player_1, player_2, time_limit=300000):
+    # Games are called a tie after this many half moves
+    max_plies = 200
+
+    def __init__(self, player_1, player_2, time_limit=300000, time_control=None):
         self.player_1 = player_1
         self.player_2 = player_2
+        # Without a time control the players search to their own depth and
+        # time_limit is only checked after each move
         self.time_limit = time_limit
-
-    def run_game(self, initial_board_fen:str = None):
-        board = chess.Board()
+        self.time_control = time_control
+
+    def send_moves(self, player, board):
+        # Incremental bots only get the moves they have not seen yet
+        known = self.known_moves[id(player)]
+        for move in board.move_stack[known:]:
+            player.push_move(move)
+        self.known_moves[id(player)] = len(board.move_stack)
+
+    def ask_move(self, player, board, clock):
+        if hasattr(player, "push_move"):
+            self.send_moves(player, board)
+            move = player.go(clock)
+            self.known_moves[id(player)] = len(board.move_stack) + 1
+            return move
+        if getattr(player, "uses_clock", False):
+            return player(board.fen(), clock)
+        return player(board.fen())
+
+    def play_game(self, initial_board_fen:str = None, on_move=None):
+        # Plays one game without any output. player_1 plays white and
+        # player_2 black, also when the initial position has black to move.
+        board = chess.Board(initial_board_fen) if initial_board_fen else chess.Board()
+        players = {chess.WHITE: self.player_1, chess.BLACK: self.player_2}
+        clocks = {chess.WHITE: None, chess.BLACK: None}
+        if self.time_control is not None:
+            clocks = {chess.WHITE: Clock(self.time_control), chess.BLACK: Clock(self.time_control)}
+        self.known_moves = {}
+        for player in players.values():
+            if hasattr(player, "push_move"):
+                player.new_game(board.fen())
+                self.known_moves[id(player)] = 0
 
         player_times = [0, 0]
+        # Time incremental players spent on hearing about the opponent's move,
+        # charged to their next move
+        notify_times = [0, 0]
+        move_times = []
+        # Per move statistics of players that report them, None for the others
+        search_stats = []
+        winner = None
 
         for i in count(0, 1):
-            if board.is_checkmate():
-                print("GAME OVER")
-                print("Winner is bot", (i + 1)%2 + 1, sep="_")
-                clear_output(wait=True)
-                print(f"---------Player {i % 2 + 1}----------")
-                display(board)
-
+            outcome = board.outcome(claim_draw=False)
+            if outcome is not None:
+                termination = outcome.termination.name.lower()
+                if outcome.winner is not None:
+                    winner = 1 if outcome.winner == chess.WHITE else 2
                 break
-            if i > 200:
-                print("GAME OVER")
-                print("Exceeded move limits, it's a tie")
-                clear_output(wait=True)
-                print(f"---------Player {i % 2 + 1}----------")
-                display(board)
-
+            if i > self.max_plies:
+                termination = "move_limit"
                 break
 
-            board_fen = board.fen()
-
-            start = time.time()
-            if i % 2 == 0:
-                move = self.player_1(board_fen)
+            player_number = 1 if board.turn == chess.WHITE else 2
+            clock = clocks[board.turn]
+            # Time spent on hearing about the opponent's move counts for this
+            # move, and is off the clock before the player plans its time
+            notified = notify_times[player_number - 1]
+            notify_times[player_number - 1] = 0
+            if clock is not None:
+                clock.remaining -= notified
+            start = time.perf_counter()
+            move = self.ask_move(players[board.turn], board, clock)
+            end = time.perf_counter()
+
+            player_times[player_number - 1] += end - start + notified
+            move_times.append(end - start + notified)
+            search_stats.append(getattr(players[board.turn], "lastSearchStats", None))
+
+            if clock is None:
+                out_of_time = player_times[player_number - 1] > self.time_limit
             else:
-                move = self.player_2(board_fen)
-            end = time.time()
-
-            player_times[i%2] += end - start
+                out_of_time = not clock.punch(end - start)
+            if out_of_time:
+                termination = "time_forfeit"
+                winner = 3 - player_number
+                break
 
-            if player_times[i%2] > self.time_limit:
-                print("GAME OVER")
-                print("Time limit exceeded, winner is bot", i%2+1, sep="_")
+            if move is None:
+                # A crashed or killed engine loses the game
+                termination = "no_move"
+                winner = 3 - player_number
+                break
 
             if not board.is_legal(move):
                 raise ValueError("Illegal board move. The bot it hallucinating...", move)
 
             board.push(move)
 
-            clear_output(wait=True)
-            print(f"---------Player {i % 2 + 1}----------")
-            display(board)
+            # Tell the next player about the move at once, a pondering bot
+            # can then go on with or drop its background search
+            if hasattr(players[board.turn], "push_move"):
+                start = time.perf_counter()
+                self.send_moves(players[board.turn], board)
+                notify_times[2 - player_number] += time.perf_counter() - start
+
+            if on_move is not None:
+                on_move(board, player_number)
+
+        return {
+            "initial_fen": initial_board_fen or chess.STARTING_FEN,
+            "winner": winner,
+            "termination": termination,
+            "moves": [move.uci() for move in board.move_stack],
+            "move_times": move_times,
+            "player_times": player_times,
+            "search_stats": search_stats,
+            "final_fen": board.fen(),
+        }
+
+    def show_board(self, board, player_number):
+        # Only needed in notebooks, so headless runs never import IPython
+        from IPython.display import clear_output, display
+
+        clear_output(wait=True)
+        print(f"---------Player {player_number}----------")
+        display(board)
+
+        # slow down the bots so that we can see them
+        # time.sleep(.25)
 
-            # slow down the bots so that we can see them
-            # time.sleep(.25)
-        print("Times used:", player_times)
+    def run_game(self, initial_board_fen:str = None):
+        result = self.play_game(initial_board_fen, on_move=self.show_board)
+
+        print("GAME OVER")
+        if result["termination"] == "time_forfeit":
+            print("Time limit exceeded, winner is bot", result["winner"], sep="_")
+        elif result["termination"] == "move_limit":
+            print("Exceeded move limits, it's a tie")
+        elif result["winner"] is not None:
+            print("Winner is bot", result["winner"], sep="_")
+        else:
+            print("Draw by", result["termination"].replace("_", " "))
+        print("Times used:", result["player_times"])
+        return result
 
 if __name__ == "__main__":
     # initialize the bots
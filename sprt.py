@@ -0,0 +1,181 @@
+import argparse
+from functools import partial
+import math
+
+from run_bot import MiniMaxBot, PieceValueBot, RandomBot, UciPlayer
+from tournament import Tournament
+from your_bot_file import ChessBot, TimeControl
+
+
+PLAYERS = {
+    "chessbot": ChessBot,
+    "piecevalue": PieceValueBot,
+    "minimax": MiniMaxBot,
+    "random": RandomBot,
+    "uci": UciPlayer,
+}
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+class Sprt():
+    # Sequential probability ratio test of H0: elo = elo0 against
+    # H1: elo = elo1, with the usual normal approximation of the
+    # log-likelihood ratio on the win/draw/loss counts
+    def __init__(self, elo0=0, elo1=10, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games
+
+    @staticmethod
+    def variance_of(wins, draws, losses):
+        # Per game variance of the score
+        games = wins + draws + losses
+        score = (wins + draws / 2) / games
+        return (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+
+    def variance(self):
+        return self.variance_of(self.wins, self.draws, self.losses)
+
+    def llr(self):
+        if not self.games:
+            return 0.0
+        # Half a game for results that did not happen yet, otherwise a run
+        # of wins only has no variance and never ends the test
+        wins, draws, losses = (count or 0.5 for count in (self.wins, self.draws, self.losses))
+        games = wins + draws + losses
+        score = (wins + draws / 2) / games
+        variance = self.variance_of(wins, draws, losses) / games
+        score0 = expected_score(self.elo0)
+        score1 = expected_score(self.elo1)
+        return (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    def status(self):
+        llr = self.llr()
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+    def elo(self, z=1.96):
+        # Elo difference with a 95% confidence interval
+        score = self.score()
+        error = z * math.sqrt(self.variance() / self.games)
+        return score_to_elo(score), score_to_elo(score - error), score_to_elo(score + error)
+
+    def los(self):
+        # Likelihood of superiority, draws carry no information
+        if not self.wins + self.losses:
+            return 0.5
+        return 0.5 * (1 + math.erf((self.wins - self.losses) / math.sqrt(2 * (self.wins + self.losses))))
+
+    def summary(self):
+        elo, low, high = self.elo() if self.games else (0.0, -math.inf, math.inf)
+        return {
+            "games": self.games, "wins": self.wins, "draws": self.draws, "losses": self.losses,
+            "elo": elo, "elo_low": low, "elo_high": high, "los": self.los(),
+            "llr": self.llr(), "lower": self.lower, "upper": self.upper, "status": self.status(),
+        }
+
+
+def parse_player(spec):
+    # "name" or "name:key=value,key=value", e.g. "chessbot:hashSizeMB=64" or
+    # "uci:command=./engine". Values are read as numbers where possible.
+    name, _, arguments = spec.partition(":")
+    keywords = {}
+    for argument in filter(None, arguments.split(",")):
+        key, _, value = argument.partition("=")
+        try:
+            value = int(value)
+        except ValueError:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        keywords[key] = value
+    return partial(PLAYERS[name], **keywords)
+
+
+def run_sprt(candidate, baseline, sprt, max_games=1000, openings=None, time_control=None,
+             processes=None, jsonl_path=None, pgn_path=None, verbose=True):
+    tournament = Tournament(candidate, baseline, games=max_games, openings=openings,
+                            time_control=time_control, processes=processes, jsonl_path=jsonl_path,
+                            pgn_path=pgn_path, names=("candidate", "baseline"))
+
+    def on_result(result):
+        if result["winner"] is None:
+            sprt.add(0.5)
+        else:
+            sprt.add(1 if result["winner"] == "candidate" else 0)
+        if verbose:
+            summary = sprt.summary()
+            print(f"{summary['games']} games +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+                  f"elo {summary['elo']:.1f} [{summary['elo_low']:.1f}, {summary['elo_high']:.1f}] "
+                  f"los {summary['los']:.1%} llr {summary['llr']:.2f} ({summary['lower']:.2f}, {summary['upper']:.2f})")
+        return sprt.status() is not None
+
+    results = tournament.run(on_result)
+    return sprt.summary(), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a candidate against a baseline until an SPRT decides.")
+    parser.add_argument("--candidate", default="chessbot", help="player spec, e.g. chessbot:evalPath=eval.json")
+    parser.add_argument("--baseline", default="piecevalue:max_depth=1", help="player spec, e.g. chessbot:workers=1")
+    parser.add_argument("--elo0", type=float, default=0)
+    parser.add_argument("--elo1", type=float, default=10)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--max-games", type=int, default=1000)
+    parser.add_argument("--time", type=float, default=10,
+                        help="seconds per game and player, 0 for untimed games at the players' own depth")
+    parser.add_argument("--increment", type=float, default=0.1)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--openings", help="file with one FEN per line")
+    parser.add_argument("--jsonl", help="append every game to this JSON lines file")
+    parser.add_argument("--pgn", help="append every game to this PGN file")
+    arguments = parser.parse_args()
+
+    openings = None
+    if arguments.openings:
+        with open(arguments.openings) as file:
+            openings = [line.strip() for line in file if line.strip()]
+    summary, _ = run_sprt(parse_player(arguments.candidate), parse_player(arguments.baseline),
+                          Sprt(arguments.elo0, arguments.elo1, arguments.alpha, arguments.beta),
+                          arguments.max_games, openings,
+                          TimeControl(arguments.time, arguments.increment) if arguments.time else None,
+                          arguments.processes, arguments.jsonl, arguments.pgn)
+    if summary["status"] == "H1":
+        print(f"H1 accepted: the candidate is at least {arguments.elo1} Elo stronger")
+    elif summary["status"] == "H0":
+        print(f"H0 accepted: the candidate is not {arguments.elo1} Elo stronger")
+    else:
+        print("No decision within the game limit")
+    print(f"Elo {summary['elo']:.1f} [{summary['elo_low']:.1f}, {summary['elo_high']:.1f}], LOS {summary['los']:.1%}")
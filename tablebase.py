@@ -0,0 +1,245 @@
+import argparse
+from collections import defaultdict
+from itertools import combinations_with_replacement, product
+import os
+import time
+
+import chess
+
+from your_bot_file import ChessBot, Tablebases, TABLEBASE_CODES, TABLEBASE_ORDER, tablebaseStrength
+
+
+# Marks index slots that are not a legal position in remaining
+INVALID = 255
+
+
+def sort_pieces(pieces):
+    return "".join(sorted(pieces, key=TABLEBASE_ORDER.index))
+
+
+def canonical(white, black):
+    # Tables are stored with the stronger side as white
+    white = sort_pieces(white)
+    black = sort_pieces(black)
+    if tablebaseStrength(white) < tablebaseStrength(black):
+        white, black = black, white
+    return white + "v" + black
+
+
+def dependencies(signature):
+    # Tables that a capture or a promotion can lead to
+    white, black = signature.split("v")
+    result = set()
+    for own, other, own_is_white in ((white, black, True), (black, white, False)):
+        for i, piece in enumerate(own):
+            if piece == "K":
+                continue
+            rest = own[:i] + own[i + 1:]
+            changed = [rest]
+            if piece == "P":
+                changed += [rest + promotion for promotion in "QRBN"]
+            for pieces in changed:
+                result.add(canonical(pieces, other) if own_is_white else canonical(other, pieces))
+    result.discard("KvK")
+    return result
+
+
+def signatures(piece_count):
+    result = set()
+    for white_count in range(piece_count - 1):
+        black_count = piece_count - 2 - white_count
+        for white in combinations_with_replacement("QRBNP", white_count):
+            for black in combinations_with_replacement("QRBNP", black_count):
+                result.add(canonical("K" + "".join(white), "K" + "".join(black)))
+    return sorted(result)
+
+
+def predecessors(i, size, codes, weights):
+    # Positions one non-capturing, non-promoting move before position i.
+    # They have the side that just moved to move again.
+    turn = 1 if i < size else 0
+    index = i % size
+    squares = []
+    rest = index
+    for weight in weights:
+        squares.append(rest // weight)
+        rest %= weight
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    empty = ~occupied & chess.BB_ALL
+
+    mover = turn ^ 1
+    offset = 0 if mover == 1 else size
+    for k, code in enumerate(codes):
+        if code >> 3 != mover:
+            continue
+        square = squares[k]
+        piece_type = code & 7
+        if piece_type == chess.PAWN:
+            origins = []
+            step = -8 if mover else 8
+            rank = chess.square_rank(square)
+            if (rank >= 2 if mover else rank <= 5) and empty & (1 << (square + step)):
+                origins.append(square + step)
+                if rank == (3 if mover else 4) and empty & (1 << (square + 2 * step)):
+                    origins.append(square + 2 * step)
+        else:
+            if piece_type == chess.KING:
+                attacks = chess.BB_KING_ATTACKS[square]
+            elif piece_type == chess.KNIGHT:
+                attacks = chess.BB_KNIGHT_ATTACKS[square]
+            else:
+                attacks = 0
+                if piece_type != chess.ROOK:
+                    attacks |= chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+                if piece_type != chess.BISHOP:
+                    attacks |= chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] | \
+                        chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]
+            origins = chess.SquareSet(attacks & empty)
+        for origin in origins:
+            yield offset + index + (origin - square) * weights[k]
+
+
+def generate_table(signature, tablebases, position):
+    white, black = signature.split("v")
+    # Same piece order as Tablebases.probe: kings, white pieces, black pieces
+    codes = [8 + chess.KING, chess.KING] + [8 + TABLEBASE_CODES[piece] for piece in white[1:]] + \
+        [TABLEBASE_CODES[piece] for piece in black[1:]]
+    count = len(codes)
+    size = 64 ** count
+    weights = [64 ** (count - 1 - k) for k in range(count)]
+
+    # values holds the result in file format: 0 for draws (or not yet
+    # known), otherwise distance to mate in plies plus one
+    values = bytearray(2 * size)
+    remaining = bytearray(2 * size)
+    win_in = bytearray(2 * size)
+    loss_in = bytearray(2 * size)
+    drawable = bytearray(2 * size)
+    done = bytearray(2 * size)
+    buckets = defaultdict(list)
+
+    # Count the moves of every position. Captures and promotions leave the
+    # table, their results come straight from the smaller tables.
+    for turn in (1, 0):
+        offset = 0 if turn else size
+        for index, squares in enumerate(product(range(64), repeat=count)):
+            i = offset + index
+            if len(set(squares)) < count or chess.square_distance(squares[0], squares[1]) <= 1 or \
+                    any(code & 7 == chess.PAWN and (1 << square) & chess.BB_BACKRANKS
+                        for code, square in zip(codes, squares)):
+                remaining[i] = INVALID
+                continue
+            position.setPieces(zip(codes, squares), turn)
+            # The side that just moved can not have left its king in check
+            if position.isAttacked(squares[turn], turn):
+                remaining[i] = INVALID
+                continue
+
+            legal = 0
+            in_table = 0
+            win = 0
+            loss = 0
+            draw = 0
+            for move in position.generateMoves():
+                converting = move >> 12 or position.isCapture(move)
+                if not position.makeMove(move):
+                    continue
+                legal += 1
+                if not converting:
+                    position.unmakeMove()
+                    in_table += 1
+                    continue
+                value = tablebases.probe(position)
+                position.unmakeMove()
+                if value is None:
+                    raise RuntimeError(f"{signature} needs the tables in {sorted(dependencies(signature))}")
+                if value == 0:
+                    draw = 1
+                elif value % 2 == 1:
+                    # The opponent gets mated in value - 1 plies
+                    if not win or value < win:
+                        win = value
+                elif value > loss:
+                    loss = value
+
+            if legal == 0:
+                if position.inCheck():
+                    values[i] = 1
+                    buckets[0].append(i)
+                else:
+                    drawable[i] = 1
+                continue
+            remaining[i] = in_table
+            win_in[i] = win
+            loss_in[i] = loss
+            drawable[i] = draw
+            if win:
+                buckets[win].append(i)
+            elif in_table == 0 and not draw:
+                values[i] = loss + 1
+                buckets[loss].append(i)
+
+    # Walk back from the decided positions in order of their distance to mate
+    ply = 0
+    while buckets:
+        for i in buckets.pop(ply, []):
+            if done[i]:
+                continue
+            if values[i] == 0:
+                values[i] = ply + 1
+            elif values[i] != ply + 1:
+                continue
+            done[i] = 1
+            for j in predecessors(i, size, codes, weights):
+                if remaining[j] == INVALID or values[j]:
+                    continue
+                if ply % 2 == 0:
+                    # Position i is lost for the side to move, so j wins
+                    values[j] = ply + 2
+                    buckets[ply + 1].append(j)
+                else:
+                    remaining[j] -= 1
+                    if ply + 1 > loss_in[j]:
+                        loss_in[j] = ply + 1
+                    if remaining[j] == 0 and not drawable[j] and not win_in[j]:
+                        values[j] = loss_in[j] + 1
+                        buckets[loss_in[j]].append(j)
+        ply += 1
+    return values
+
+
+def generate(signature, directory, tablebases=None, position=None):
+    path = os.path.join(directory, signature + ".tb")
+    if os.path.exists(path):
+        return
+    if tablebases is None:
+        tablebases = Tablebases(directory, maxPieces=len(signature) - 1)
+        # Only move generation is needed, so keep the bot's search table tiny
+        position = ChessBot(hashSizeMB=1).position
+    for dependency in sorted(dependencies(signature), key=len):
+        generate(dependency, directory, tablebases, position)
+
+    start = time.time()
+    values = generate_table(signature, tablebases, position)
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(Tablebases.MAGIC)
+        file.write(values)
+    print(f"Generated {signature} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate distance-to-mate tablebases for ChessBot.")
+    parser.add_argument("signatures", nargs="*", help="endings like KQvK or KRvKP")
+    parser.add_argument("--pieces", type=int, help="generate every ending with up to this many pieces")
+    parser.add_argument("-d", "--directory", default="tablebases")
+    arguments = parser.parse_args()
+
+    wanted = [canonical(*signature.upper().split("V")) for signature in arguments.signatures]
+    if arguments.pieces:
+        for piece_count in range(3, arguments.pieces + 1):
+            wanted += signatures(piece_count)
+    for signature in wanted:
+        generate(signature, arguments.directory)
@@ -0,0 +1,162 @@
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+
+import chess
+
+from your_bot_file import ChessBot, MAX_SEARCH_DEPTH
+
+
+# Set in every worker process by start_worker
+bot = None
+budget = None
+
+
+def load_suite(path):
+    # EPD positions with bm (best moves) and/or am (moves to avoid)
+    positions = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            board, operations = chess.Board.from_epd(line)
+            if "bm" not in operations and "am" not in operations:
+                continue
+            positions.append({
+                "id": operations.get("id") or f"{path}:{number}",
+                "fen": board.fen(),
+                "bm": [move.uci() for move in operations.get("bm", [])],
+                "am": [move.uci() for move in operations.get("am", [])],
+            })
+    return positions
+
+
+def start_worker(hash_size, eval_path, position_budget):
+    # One bot per worker, cleared between positions so results do not depend
+    # on which positions a worker saw before
+    global bot, budget
+    bot = ChessBot(maxDepth=MAX_SEARCH_DEPTH, hashSizeMB=hash_size, evalPath=eval_path)
+    bot.stopEvent = threading.Event()
+    budget = position_budget
+
+
+def is_solution(move, position):
+    if position["bm"] and move not in position["bm"]:
+        return False
+    return move not in position["am"]
+
+
+def solve(position):
+    seconds, nodes, depth = budget
+    bot.new_game(position["fen"])
+    bot.maxDepth = depth
+    bot.nodeLimit = nodes
+    bot.stopEvent.clear()
+    timer = threading.Timer(seconds, bot.stopEvent.set) if seconds else None
+
+    # Elapsed time, nodes and best move after every finished iteration
+    iterations = []
+    start = time.perf_counter()
+    bot.onIteration = lambda stats: iterations.append((stats["depth"], stats["pv"][0] if stats["pv"] else None,
+                                                       time.perf_counter() - start, bot.nodes))
+    if timer is not None:
+        timer.start()
+    try:
+        move = bot(None).uci()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    seconds = time.perf_counter() - start
+
+    result = dict(position)
+    result.update({"move": move, "solved": is_solution(move, position), "seconds": seconds, "nodes": bot.nodes,
+                   "depth": iterations[-1][0] if iterations else 0,
+                   "solve_depth": None, "solve_seconds": None, "solve_nodes": None})
+    if result["solved"]:
+        # The solution counts from the iteration that found it for good
+        first = len(iterations)
+        while first > 0 and is_solution(iterations[first - 1][1], position):
+            first -= 1
+        if first < len(iterations):
+            result["solve_depth"], _, result["solve_seconds"], result["solve_nodes"] = iterations[first]
+    return result
+
+
+def run_suite(positions, seconds=1.0, nodes=None, depth=MAX_SEARCH_DEPTH, processes=None, hash_size=16,
+              eval_path=None, on_result=None):
+    position_budget = (seconds, nodes, depth)
+    processes = processes or multiprocessing.cpu_count()
+    if processes > 1:
+        with multiprocessing.Pool(processes, start_worker, (hash_size, eval_path, position_budget)) as pool:
+            results = []
+            for result in pool.imap(solve, positions):
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    else:
+        start_worker(hash_size, eval_path, position_budget)
+        results = []
+        for result in map(solve, positions):
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+        bot.close()
+    return results
+
+
+def summarize(results):
+    solved = [result for result in results if result["solved"]]
+    return {
+        "positions": len(results),
+        "solved": len(solved),
+        "solve_rate": len(solved) / len(results) if results else 0.0,
+        "seconds": sum(result["seconds"] for result in results),
+        "nodes": sum(result["nodes"] for result in results),
+        "mean_solve_seconds": sum(result["solve_seconds"] for result in solved) / len(solved) if solved else None,
+        "mean_solve_nodes": sum(result["solve_nodes"] for result in solved) / len(solved) if solved else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run ChessBot on EPD test suites with bm/am operations.")
+    parser.add_argument("suites", nargs="+", help="EPD files")
+    parser.add_argument("--time", type=float, help="seconds per position, 1 when neither --time nor --nodes is given")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--depth", type=int, default=MAX_SEARCH_DEPTH, help="deepest iteration per position")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB per process")
+    parser.add_argument("--eval", help="evaluation weights fitted by tuner.py")
+    parser.add_argument("-o", "--output", help="write the results to this .json or .csv file")
+    arguments = parser.parse_args()
+
+    seconds = arguments.time
+    if seconds is None and arguments.nodes is None:
+        seconds = 1.0
+    positions = [position for path in arguments.suites for position in load_suite(path)]
+
+    def print_result(result):
+        status = "ok  " if result["solved"] else "FAIL"
+        found = f" found at depth {result['solve_depth']} after {result['solve_seconds']:.2f}s" \
+            if result["solved"] else ""
+        print(f"{status} {result['id']}: {result['move']} (bm {' '.join(result['bm']) or '-'}, "
+              f"am {' '.join(result['am']) or '-'}){found}")
+
+    results = run_suite(positions, seconds, arguments.nodes, arguments.depth, arguments.processes, arguments.hash,
+                        arguments.eval, print_result)
+    summary = summarize(results)
+    print(f"Solved {summary['solved']} of {summary['positions']} ({summary['solve_rate']:.1%}) "
+          f"in {summary['seconds']:.1f}s and {summary['nodes']} nodes")
+    if arguments.output:
+        if arguments.output.endswith(".csv"):
+            import pandas as pd
+
+            table = pd.DataFrame(results)
+            table["bm"] = table["bm"].str.join(" ")
+            table["am"] = table["am"].str.join(" ")
+            table.to_csv(arguments.output, index=False)
+        else:
+            with open(arguments.output, "w") as file:
+                json.dump({"summary": summary, "positions": results}, file, indent=2)
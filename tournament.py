@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+import json
+import multiprocessing
+
+import chess
+import chess.pgn
+
+from run_bot import Judge, PieceValueBot
+from your_bot_file import ChessBot
+
+
+# Set in every worker process by start_worker
+players = None
+time_control = None
+
+
+def start_worker(tournament_players, tournament_time_control):
+    global players, time_control
+    players = tournament_players
+    time_control = tournament_time_control
+
+
+def play_tournament_game(game):
+    # The bots are constructed inside the worker, so every game starts with
+    # fresh bots and nothing but the schedule entry has to be sent over
+    white = players[game["white"]]()
+    black = players[game["black"]]()
+    try:
+        result = Judge(white, black, time_control=time_control).play_game(game["initial_fen"])
+    finally:
+        for bot in (white, black):
+            if hasattr(bot, "close"):
+                bot.close()
+
+    result.update(game)
+    if result["winner"] is None:
+        result["result"] = "1/2-1/2"
+    else:
+        result["result"] = "1-0" if result["winner"] == 1 else "0-1"
+        result["winner"] = game["white"] if result["winner"] == 1 else game["black"]
+    return result
+
+
+def result_to_pgn(result):
+    board = chess.Board(result["initial_fen"])
+    for move in result["moves"]:
+        board.push_uci(move)
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Tournament"
+    game.headers["Round"] = str(result["game"] + 1)
+    game.headers["White"] = result["white"]
+    game.headers["Black"] = result["black"]
+    game.headers["Result"] = result["result"]
+    game.headers["Termination"] = result["termination"]
+    return str(game)
+
+
+class Tournament():
+    def __init__(self, player_1, player_2, games=2, openings=None, time_control=None,
+                 processes=None, jsonl_path=None, pgn_path=None, names=("player_1", "player_2")):
+        # Players are given as classes or other picklable callables that
+        # create a bot, e.g. functools.partial(ChessBot, maxDepth=3)
+        self.players = {names[0]: player_1, names[1]: player_2}
+        self.names = names
+        self.games = games
+        self.openings = openings or [chess.STARTING_FEN]
+        # Without a time control the games are untimed and the bots search
+        # to their own depth
+        self.time_control = time_control
+        self.processes = processes or multiprocessing.cpu_count()
+        self.jsonl_path = jsonl_path
+        self.pgn_path = pgn_path
+
+    def schedule(self):
+        # Every opening is played twice in a row with the colors swapped
+        games = []
+        for game in range(self.games):
+            first, second = self.names if game % 2 == 0 else self.names[::-1]
+            games.append({
+                "game": game,
+                "white": first,
+                "black": second,
+                "initial_fen": self.openings[(game // 2) % len(self.openings)],
+            })
+        return games
+
+    def run(self, on_result=None):
+        # on_result is called with every finished game, the run stops early
+        # when it returns True
+        games = self.schedule()
+        results = []
+        jsonl_file = open(self.jsonl_path, "a") if self.jsonl_path else None
+        pgn_file = open(self.pgn_path, "a") if self.pgn_path else None
+        executor = None
+        try:
+            if self.processes > 1:
+                # Unlike multiprocessing.Pool the executor's workers are not
+                # daemons, so bots may start processes of their own, such as
+                # ChessBot(workers=2) or ChessBot(ponder=True)
+                executor = ProcessPoolExecutor(self.processes, initializer=start_worker,
+                                               initargs=(self.players, self.time_control))
+                finished = (future.result() for future in
+                            as_completed([executor.submit(play_tournament_game, game) for game in games]))
+            else:
+                start_worker(self.players, self.time_control)
+                finished = map(play_tournament_game, games)
+
+            # Results are written as soon as a game ends, so an interrupted
+            # run still keeps every finished game
+            for result in finished:
+                results.append(result)
+                if jsonl_file:
+                    jsonl_file.write(json.dumps(result) + "\n")
+                    jsonl_file.flush()
+                if pgn_file:
+                    pgn_file.write(result_to_pgn(result) + "\n\n")
+                    pgn_file.flush()
+                if on_result is not None and on_result(result):
+                    break
+        finally:
+            if executor is not None:
+                # Drops the games that have not started, the running ones are
+                # played out so that their bots get closed
+                executor.shutdown(cancel_futures=True)
+            for file in (jsonl_file, pgn_file):
+                if file:
+                    file.close()
+
+        # Imported here so that worker processes do not pay for pandas
+        import pandas as pd
+
+        return pd.DataFrame(results).sort_values("game").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # Fixed depth games without a clock
+    tournament = Tournament(partial(ChessBot, maxDepth=3), partial(PieceValueBot, max_depth=1), games=4,
+                            jsonl_path="tournament.jsonl", pgn_path="tournament.pgn",
+                            names=("ChessBot", "PieceValueBot"))
+    results = tournament.run()
+    print(results[["game", "white", "black", "winner", "termination"]])
+    print(results["winner"].value_counts(dropna=False))
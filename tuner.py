@@ -0,0 +1,264 @@
+import argparse
+import json
+import time
+
+import chess
+import numpy as np
+
+from your_bot_file import ChessBot, PHASE_WEIGHTS, TOTAL_PHASE
+
+
+# Results are stored as white's score times two, so they fit in a uint8
+RESULTS = {"1-0": 2, "0-1": 0, "1/2-1/2": 1}
+# Positions this close to the start of a game are mostly book moves
+SKIP_PLIES = 8
+# The exported tables are in the units of createPieceSquareTables
+TABLE_SCALE = 3000
+
+
+def encode_board(board):
+    # One uint8 per square with the ChessBot piece code, color * 8 + piece type
+    codes = np.zeros(64, dtype=np.uint8)
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                codes[square] = color * 8 + piece_type
+    return codes
+
+
+def is_quiet(board, move=None):
+    # The static evaluation is only meaningful when nothing hangs: skip
+    # positions in check and the ones where a capture or promotion was played
+    if board.is_check():
+        return False
+    return move is None or not (move.promotion or board.is_capture(move))
+
+
+def game_result(game):
+    # Judge results carry the winner as 1 or 2, tournament results also
+    # have the PGN result string
+    if "result" in game:
+        return RESULTS[game["result"]]
+    if game["winner"] is None:
+        return 1
+    return 2 if game["winner"] == 1 else 0
+
+
+def read_games(path):
+    # Positions of the games in a JSON lines file written by Tournament, or
+    # any other file with one Judge.play_game result per line
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            game = json.loads(line)
+            result = game_result(game)
+            board = chess.Board(game["initial_fen"])
+            moves = [chess.Move.from_uci(move) for move in game["moves"]]
+            for ply, move in enumerate(moves + [None]):
+                if ply >= SKIP_PLIES and is_quiet(board, move) and not board.is_game_over():
+                    yield encode_board(board), result
+                if move is not None:
+                    board.push(move)
+
+
+def read_epd(path):
+    # EPD lines with the result either as a c9 opcode, as in
+    # `... c9 "1-0";`, or as a trailing score like `... [0.5]`
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.endswith("]"):
+                line, _, score = line[:-1].rpartition("[")
+                board = chess.Board.from_epd(line.strip())[0]
+                result = round(float(score) * 2)
+            else:
+                board, operations = chess.Board.from_epd(line)
+                result = RESULTS[operations["c9"]]
+            yield encode_board(board), result
+
+
+def load_positions(paths):
+    codes = []
+    results = []
+    for path in paths:
+        if path.endswith(".npz"):
+            data = np.load(path)
+            codes.append(data["codes"])
+            results.append(data["results"])
+            continue
+        reader = read_games if path.endswith((".jsonl", ".json")) else read_epd
+        file_codes = []
+        file_results = []
+        for board_codes, result in reader(path):
+            file_codes.append(board_codes)
+            file_results.append(result)
+        codes.append(np.array(file_codes, dtype=np.uint8).reshape(-1, 64))
+        results.append(np.array(file_results, dtype=np.uint8))
+    return np.concatenate(codes), np.concatenate(results)
+
+
+class Features():
+    # Sparse view of a batch of encoded positions: one entry per piece with
+    # its row in the batch, its table index (piece type - 1) * 64 + square as
+    # seen from white, its sign and the middlegame share of the position
+    def __init__(self, codes):
+        rows, squares = np.nonzero(codes)
+        pieces = codes[rows, squares]
+        piece_types = (pieces & 7).astype(np.intp)
+        white = pieces >> 3 == 1
+        self.count = len(codes)
+        self.rows = rows
+        self.piece_types = piece_types
+        # Black's tables are white's mirrored along the ranks
+        self.indices = (piece_types - 1) * 64 + np.where(white, squares, squares ^ 56)
+        self.signs = np.where(white, 1.0, -1.0)
+        phase_weights = np.array(PHASE_WEIGHTS, dtype=np.float64)
+        phases = np.minimum(np.bincount(rows, phase_weights[piece_types], self.count), TOTAL_PHASE)
+        self.middlegame = (phases / TOTAL_PHASE)[rows]
+
+
+class Weights():
+    # Evaluation parameters as flat arrays: material per piece type and one
+    # middlegame and one endgame value per piece type and square, all in pawns
+    def __init__(self, material, middlegame, endgame):
+        self.material = material
+        self.middlegame = middlegame
+        self.endgame = endgame
+
+    @classmethod
+    def from_bot(cls, bot):
+        material = np.array([bot.pieceValues.get(piece_type, 0) for piece_type in range(7)], dtype=np.float64)
+        # The flat bot tables hold white's values at (8 + piece type) * 64 + square
+        white = [(8 + piece_type) * 64 + square for piece_type in chess.PIECE_TYPES for square in chess.SQUARES]
+        middlegame = np.array([bot.middlegameTables[i] for i in white])
+        endgame = np.array([bot.endgameTables[i] for i in white])
+        return cls(material, middlegame, endgame)
+
+    def vector(self):
+        return np.concatenate([self.material, self.middlegame, self.endgame])
+
+    @classmethod
+    def from_vector(cls, vector):
+        return cls(vector[:7], vector[7:7 + 384], vector[7 + 384:])
+
+    def evaluate(self, features):
+        # Same as ChessBot.evaluate: material plus the tapered table values
+        values = self.material[features.piece_types] + self.endgame[features.indices] + \
+            features.middlegame * (self.middlegame[features.indices] - self.endgame[features.indices])
+        return np.bincount(features.rows, features.signs * values, features.count)
+
+    def gradient(self, features, errors):
+        # Gradient of the summed loss, given its derivative per position
+        weights = errors[features.rows] * features.signs
+        material = np.bincount(features.piece_types, weights, 7)
+        # The king is on the board on both sides and has no material value
+        material[chess.KING] = 0
+        middlegame = np.bincount(features.indices, weights * features.middlegame, 384)
+        endgame = np.bincount(features.indices, weights * (1 - features.middlegame), 384)
+        return np.concatenate([material, middlegame, endgame])
+
+    def export(self):
+        # Tables as rows from the eighth rank down to the first, like the
+        # hand-written ones in createPieceSquareTables
+        def table(values, piece_type):
+            return [[round(values[(piece_type - 1) * 64 + (7 - row) * 8 + file] * TABLE_SCALE)
+                     for file in range(8)] for row in range(8)]
+
+        return {
+            "pieceValues": {chess.PIECE_NAMES[piece_type]: round(float(self.material[piece_type]), 4)
+                            for piece_type in chess.PIECE_TYPES},
+            "middlegame": {chess.PIECE_NAMES[piece_type]: table(self.middlegame, piece_type)
+                           for piece_type in chess.PIECE_TYPES},
+            "endgame": {chess.PIECE_NAMES[piece_type]: table(self.endgame, piece_type)
+                        for piece_type in chess.PIECE_TYPES},
+        }
+
+
+def log_loss(evaluations, scores, scale):
+    # Cross entropy between the predicted and the actual score of white
+    predictions = 1 / (1 + np.exp(-scale * evaluations))
+    predictions = np.clip(predictions, 1e-12, 1 - 1e-12)
+    return -np.mean(scores * np.log(predictions) + (1 - scores) * np.log(1 - predictions))
+
+
+def fit_scale(evaluations, scores):
+    # The scale that turns the starting evaluation into win probabilities
+    # best, searched coarsely and then around the best value
+    candidates = np.linspace(0.05, 5, 100)
+    for _ in range(2):
+        losses = [log_loss(evaluations, scores, scale) for scale in candidates]
+        best = candidates[int(np.argmin(losses))]
+        step = candidates[1] - candidates[0]
+        candidates = np.linspace(max(best - step, 1e-3), best + step, 41)
+    return float(best)
+
+
+def tune(codes, results, weights, epochs=20, batch_size=16384, learning_rate=0.001, regularization=1e-4,
+         scale=None, seed=0, verbose=True):
+    scores = results.astype(np.float64) / 2
+    generator = np.random.default_rng(seed)
+    if scale is None:
+        sample = generator.choice(len(codes), min(len(codes), 200000), replace=False)
+        scale = fit_scale(weights.evaluate(Features(codes[sample])), scores[sample])
+
+    # Adam on mini-batches, with an L2 pull towards the starting weights so
+    # that squares that rarely see a piece keep their hand-written values
+    start = weights.vector()
+    vector = start.copy()
+    mean = np.zeros_like(vector)
+    variance = np.zeros_like(vector)
+    step = 0
+    for epoch in range(epochs):
+        began = time.time()
+        order = generator.permutation(len(codes))
+        total = 0.0
+        for first in range(0, len(codes), batch_size):
+            batch = order[first:first + batch_size]
+            features = Features(codes[batch])
+            current = Weights.from_vector(vector)
+            evaluations = current.evaluate(features)
+            predictions = 1 / (1 + np.exp(-scale * evaluations))
+            total += log_loss(evaluations, scores[batch], scale) * len(batch)
+            # d loss / d evaluation of the log loss of a sigmoid
+            errors = scale * (predictions - scores[batch]) / len(batch)
+            gradient = current.gradient(features, errors) + regularization * (vector - start)
+
+            step += 1
+            mean = 0.9 * mean + 0.1 * gradient
+            variance = 0.999 * variance + 0.001 * gradient ** 2
+            vector -= learning_rate * (mean / (1 - 0.9 ** step)) / (np.sqrt(variance / (1 - 0.999 ** step)) + 1e-8)
+        if verbose:
+            print(f"epoch {epoch + 1} loss {total / len(codes):.5f} ({time.time() - began:.1f}s)")
+    return Weights.from_vector(vector), scale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit ChessBot's piece values and piece-square tables to game results.")
+    parser.add_argument("inputs", nargs="+",
+                        help="tournament .jsonl game logs, EPD files with results or .npz files saved by --save")
+    parser.add_argument("-o", "--output", default="eval.json", help="load it with ChessBot(evalPath=...)")
+    parser.add_argument("--save", help="also write the encoded positions to this .npz file")
+    parser.add_argument("--start", help="start from this evaluation file instead of the hand-written values")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16384)
+    parser.add_argument("--learning-rate", type=float, default=0.001, help="in pawns per step")
+    parser.add_argument("--regularization", type=float, default=1e-4)
+    parser.add_argument("--scale", type=float, help="sigmoid scale per pawn, fitted to the data when not given")
+    arguments = parser.parse_args()
+
+    began = time.time()
+    codes, results = load_positions(arguments.inputs)
+    print(f"Loaded {len(codes)} positions in {time.time() - began:.1f}s")
+    if arguments.save:
+        np.savez_compressed(arguments.save, codes=codes, results=results)
+
+    bot = ChessBot(hashSizeMB=1, evalPath=arguments.start)
+    weights, scale = tune(codes, results, Weights.from_bot(bot), arguments.epochs, arguments.batch_size,
+                          arguments.learning_rate, arguments.regularization, arguments.scale)
+    bot.close()
+    print(f"Sigmoid scale {scale:.3f} per pawn")
+    with open(arguments.output, "w") as file:
+        json.dump(weights.export(), file)
@@ -0,0 +1,170 @@
+import argparse
+import sys
+import threading
+import time
+
+import chess
+
+from run_bot import MiniMaxBot, PieceValueBot, RandomBot
+from your_bot_file import ChessBot, Clock, MATE_THRESHOLD, MAX_SEARCH_DEPTH, TimeControl
+
+
+def create_bot(arguments):
+    if arguments.bot == "chessbot":
+        return ChessBot(maxDepth=arguments.depth, hashSizeMB=arguments.hash, bookPath=arguments.book,
+                        tablebasePath=arguments.tablebases, evalPath=arguments.eval)
+    if arguments.bot == "piecevalue":
+        return PieceValueBot(arguments.depth, reference=arguments.reference)
+    if arguments.bot == "minimax":
+        return MiniMaxBot(arguments.depth, reference=arguments.reference)
+    return RandomBot()
+
+
+class UciEngine():
+    # Speaks the UCI protocol on stdin/stdout for one bot. Searches run in a
+    # thread, so stop, isready and quit are answered while searching.
+    def __init__(self, bot, name, output=sys.stdout):
+        self.bot = bot
+        self.name = name
+        self.output = output
+        self.board = chess.Board()
+        self.default_depth = getattr(bot, "maxDepth", None)
+        self.search = None
+        self.stop_event = threading.Event()
+        self.timer = None
+        self.search_start = None
+        if isinstance(bot, ChessBot):
+            bot.stopEvent = self.stop_event
+            bot.onIteration = self.send_info
+
+    def send(self, line):
+        print(line, file=self.output, flush=True)
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line.split()):
+                break
+        self.stop()
+
+    def handle(self, tokens):
+        # Returns False on quit
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send(f"id name {self.name}")
+            self.send("id author chess-bot-competition")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            if hasattr(self.bot, "new_game"):
+                self.bot.new_game()
+            self.board = chess.Board()
+        elif command == "position":
+            self.stop()
+            self.set_position(tokens[1:])
+        elif command == "go":
+            self.stop()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_position(self, tokens):
+        if tokens[0] == "startpos":
+            board = chess.Board()
+            tokens = tokens[1:]
+        else:
+            end = tokens.index("moves") if "moves" in tokens else len(tokens)
+            board = chess.Board(" ".join(tokens[1:end]))
+            tokens = tokens[end:]
+        for move in tokens[1:]:
+            board.push_uci(move)
+        self.board = board
+
+    def go(self, tokens):
+        values = {}
+        for name, value in zip(tokens, tokens[1:]):
+            if name in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"):
+                values[name] = int(value)
+
+        clock = None
+        depth = self.default_depth
+        own = "w" if self.board.turn == chess.WHITE else "b"
+        if f"{own}time" in values:
+            clock = Clock(TimeControl(values[f"{own}time"] / 1000, values.get(f"{own}inc", 0) / 1000,
+                                      values.get("movestogo")))
+        elif "depth" in values:
+            depth = values["depth"]
+        else:
+            # movetime, nodes and infinite search until they are stopped
+            depth = MAX_SEARCH_DEPTH
+            if "movetime" in values:
+                self.timer = threading.Timer(values["movetime"] / 1000, self.stop_event.set)
+                self.timer.start()
+
+        if isinstance(self.bot, ChessBot):
+            self.bot.nodeLimit = values.get("nodes")
+        self.stop_event.clear()
+        self.search = threading.Thread(target=self.search_move, args=(self.board.copy(), clock, depth))
+        self.search.start()
+
+    def search_move(self, board, clock, depth):
+        bot = self.bot
+        self.search_start = time.perf_counter()
+        if isinstance(bot, ChessBot):
+            bot.maxDepth = depth
+            bot.board = board
+            move = bot(None, clock)
+        elif getattr(bot, "uses_clock", False):
+            move = bot(board.fen(), clock)
+        else:
+            move = bot(board.fen())
+        self.send(f"bestmove {move.uci() if move else '0000'}")
+
+    def send_info(self, stats):
+        # Search scores are from white's side in pawns, UCI wants the side
+        # to move's view in centipawns or moves to mate
+        score = stats["score"] if self.board.turn == chess.WHITE else -stats["score"]
+        if abs(score) >= MATE_THRESHOLD:
+            # Mate scores count the depth left where the mate was found
+            plies = stats["depth"] - (abs(score) - 10000)
+            moves = (plies + 1) // 2
+            score_text = f"mate {moves if score > 0 else -moves}"
+        else:
+            score_text = f"cp {round(score * 100)}"
+        # Nodes and time count from the start of the search, not of the
+        # iteration, so GUIs can work out the speed
+        nodes = self.bot.nodes
+        seconds = time.perf_counter() - self.search_start
+        nps = round(nodes / seconds) if seconds > 0 else 0
+        self.send(f"info depth {stats['depth']} score {score_text} nodes {nodes} nps {nps} "
+                  f"time {round(seconds * 1000)} pv {' '.join(stats['pv'])}")
+
+    def stop(self):
+        if self.search is not None:
+            self.stop_event.set()
+            self.search.join()
+            self.search = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one of the bots as a UCI engine.")
+    parser.add_argument("--bot", choices=["chessbot", "piecevalue", "minimax", "random"], default="chessbot")
+    parser.add_argument("--depth", type=int, default=5, help="search depth when the GUI sets no time")
+    parser.add_argument("--hash", type=int, default=32, help="transposition table size in MB")
+    parser.add_argument("--book", help="opening book built by opening_book.py")
+    parser.add_argument("--tablebases", help="directory with tables built by tablebase.py")
+    parser.add_argument("--eval", help="evaluation weights fitted by tuner.py")
+    parser.add_argument("--reference", action="store_true",
+                        help="play the baseline bots with their original python-chess search")
+    arguments = parser.parse_args()
+
+    UciEngine(create_bot(arguments), f"{arguments.bot} (chess-bot-competition)").run()
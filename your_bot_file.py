@@ -5,17 +5,1242 @@ from enum import Enum
 
 from abc import ABC, abstractmethod
 import cProfile
-import sys
+import json
+import time
+import multiprocessing
+import mmap
+import os
+import struct
 
 class ChessBotClass(ABC):
+    # Bots that set this to True are called as bot(board_fen, clock) by the Judge
+    uses_clock = False
+
     @abstractmethod
     def __call__(self, board_fen: str) -> chess.Move:
         pass
 
 
+class IncrementalBotClass(ChessBotClass):
+    # Bots that keep their own game state between moves. The Judge prefers
+    # this protocol: it calls new_game once, push_move for every move of the
+    # opponent and go when it is the bot's turn. go plays the returned move
+    # on the bot's own board. Being called with a FEN still works too.
+    @abstractmethod
+    def new_game(self, board_fen: str = None) -> None:
+        pass
+
+    @abstractmethod
+    def push_move(self, move: chess.Move) -> None:
+        pass
+
+    @abstractmethod
+    def go(self, clock=None) -> chess.Move:
+        pass
+
+
+class TimeControl():
+    # All times are in seconds. movesToGo is the number of moves per time
+    # period (e.g. 40 moves in 90 minutes), None means sudden death.
+    def __init__(self, baseTime, increment=0, movesToGo=None):
+        self.baseTime = baseTime
+        self.increment = increment
+        self.movesToGo = movesToGo
+
+
+class Clock():
+    def __init__(self, timeControl):
+        self.timeControl = timeControl
+        self.remaining = timeControl.baseTime
+        self.increment = timeControl.increment
+        self.movesToGo = timeControl.movesToGo
+
+    def punch(self, elapsed):
+        # Returns False when the flag fell during this move
+        self.remaining -= elapsed
+        if self.remaining < 0:
+            return False
+        self.remaining += self.increment
+        if self.movesToGo is not None:
+            self.movesToGo -= 1
+            if self.movesToGo == 0:
+                self.movesToGo = self.timeControl.movesToGo
+                self.remaining += self.timeControl.baseTime
+        return True
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+MAX_SEARCH_DEPTH = 64
+
+ZOBRIST_SEED = 0x5EED
+
+# Contribution of each piece type to the game phase, indexed by piece type.
+# The starting position has the full TOTAL_PHASE, bare kings have 0.
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+TOTAL_PHASE = 24
+
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Scores beyond this are mates, see getOutcome
+MATE_THRESHOLD = 9000
+# Width of a zero window search. Scores are fractions of a pawn, far
+# coarser than this.
+MIN_WINDOW = 1e-6
+# Half width of the first aspiration window around the previous score (pawns)
+ASPIRATION_WINDOW = 0.25
+# The reduced null move search keeps at least one ply before the leaves
+NULL_MOVE_MIN_DEPTH = 4
+# Late move reductions apply to quiet moves after the first few at this depth
+LMR_MIN_DEPTH = 3
+LMR_MOVES = 3
+# Piece values for static exchange evaluation, indexed by piece type (pawns)
+SEE_VALUES = [0, 1, 3, 3, 5, 9, 100]
+# Captures that can not lift the score to alpha even with this much extra
+# positional gain are pruned in the quiescence search (pawns)
+DELTA_MARGIN = 2
+# Deepest ply the search keeps buffers for. The main search never goes past
+# MAX_SEARCH_DEPTH, the quiescence search may go on for a while after it.
+MAX_PLY = MAX_SEARCH_DEPTH + 64
+# Sorted move buffers hold value << 16 | move, this gets the move back
+MOVE_MASK = 0xFFFF
+# Transposition entries at least this deep are passed between the bot and
+# its ponder process and root-split workers
+SHARE_DEPTH = 2
+# First guesses of the seconds it takes to start and to stop pondering
+PONDER_START_TIME = 0.02
+PONDER_STOP_TIME = 0.04
+# Only results of at least this depth go through the on-disk position cache
+CACHE_MIN_DEPTH = 3
+
+
+class TranspositionTable():
+    # Rough size of one stored entry (tuple, key and score objects) in bytes
+    ENTRY_SIZE = 160
+
+    def __init__(self, sizeMB=32, maxAge=2, shareDepth=None):
+        # Every bucket holds two slots: a depth-preferred slot at an even index
+        # and an always-replace slot right after it.
+        self.bucketCount = max(1, sizeMB * 1024 * 1024 // (2 * self.ENTRY_SIZE))
+        self.entries = [None] * (2 * self.bucketCount)
+        self.maxAge = maxAge
+        self.age = 0
+        # With a shareDepth, entries at least that deep are also collected as
+        # they are stored, so deepEntries does not have to scan the table
+        self.shareDepth = math.inf if shareDepth is None else shareDepth
+        self.shared = []
+
+    def newSearch(self):
+        self.age += 1
+        self.shared = []
+
+    def clear(self):
+        self.entries = [None] * (2 * self.bucketCount)
+        self.age = 0
+        self.shared = []
+
+    def probe(self, key):
+        index = 2 * (key % self.bucketCount)
+        entry = self.entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        index = 2 * (key % self.bucketCount)
+        entry = (key, depth, bound, score, move, self.age)
+        old = self.entries[index]
+        # The depth-preferred slot keeps deep results unless they belong to
+        # positions that have not been seen for a few searches
+        if old is None or old[0] == key or depth >= old[1] or self.age - old[5] >= self.maxAge:
+            self.entries[index] = entry
+        else:
+            self.entries[index + 1] = entry
+        if depth >= self.shareDepth:
+            self.shared.append(entry)
+
+    def deepEntries(self, minDepth):
+        # Entries of the current search worth handing to another process
+        if minDepth >= self.shareDepth:
+            # Only the last entry stored for a key is handed on
+            return list({entry[0]: entry for entry in self.shared if entry[1] >= minDepth}.values())
+        age = self.age
+        return [entry for entry in self.entries if entry is not None and entry[1] >= minDepth and entry[5] == age]
+
+    def merge(self, entries):
+        for entry in entries:
+            self.store(entry[0], entry[1], entry[2], entry[3], entry[4])
+
+
+class OpeningBook():
+    # Binary book file: a header followed by (hash, move, weight) records
+    # sorted by hash. It is memory mapped and searched in place, so opening
+    # it costs nothing no matter how large it is.
+    MAGIC = b"CBBOOK01"
+    HEADER = struct.Struct("<8sQ")
+    RECORD = struct.Struct("<QHH")
+
+    def __init__(self, path, seed=None):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, bookSeed = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+        if seed is not None and bookSeed != seed:
+            raise ValueError(f"{path} was built with Zobrist seed {bookSeed}, not {seed}")
+        self.seed = bookSeed
+        self.count = (len(self.data) - self.HEADER.size) // self.RECORD.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def keyAt(self, index):
+        return struct.unpack_from("<Q", self.data, self.HEADER.size + index * self.RECORD.size)[0]
+
+    def lookup(self, key):
+        # Returns (move, weight) pairs, moves in the encodeMove layout
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.count:
+            recordKey, move, weight = self.RECORD.unpack_from(self.data, self.HEADER.size + low * self.RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+    @classmethod
+    def write(cls, path, entries, seed):
+        # entries maps (hash, move) to a weight
+        with open(path, "wb") as file:
+            file.write(cls.HEADER.pack(cls.MAGIC, seed))
+            for (key, move), weight in sorted(entries.items()):
+                file.write(cls.RECORD.pack(key, move, min(weight, 65535)))
+
+
+class PositionCache():
+    # Fixed size hash file of search results that many processes share
+    # through mmap without locks. Every slot stores the key XORed with the
+    # packed data, so a slot that another process was writing at the same
+    # time reads as a different key and is ignored.
+    MAGIC = b"CBPC0001"
+    HEADER = struct.Struct("<8sQQ")
+    RECORD = struct.Struct("<QbBHd")
+    DATA = struct.Struct("<bBHd")
+
+    def __init__(self, path, seed, sizeMB=16):
+        if not os.path.exists(path):
+            # Other processes may have an existing file mapped, so it is never
+            # truncated: the new file is written under a temporary name and
+            # linked into place. When processes start at the same time the
+            # first link wins and the others use its file.
+            slots = max(1, sizeMB * 1024 * 1024 // self.RECORD.size)
+            temporaryPath = f"{path}.{os.getpid()}.tmp"
+            with open(temporaryPath, "wb") as file:
+                file.write(self.HEADER.pack(self.MAGIC, seed, slots))
+                file.truncate(self.HEADER.size + slots * self.RECORD.size)
+            try:
+                os.link(temporaryPath, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporaryPath)
+        self.file = open(path, "r+b")
+        if os.fstat(self.file.fileno()).st_size < self.HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a position cache")
+        self.data = mmap.mmap(self.file.fileno(), 0)
+        magic, cacheSeed, self.slots = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a position cache")
+        if cacheSeed != seed:
+            raise ValueError(f"{path} was built with Zobrist seed {cacheSeed}, not {seed}")
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    @staticmethod
+    def check(data):
+        # Folds the 12 data bytes into 64 bits for the key XOR
+        return int.from_bytes(data[:8], "little") ^ int.from_bytes(data[8:], "little")
+
+    def probe(self, key):
+        # Returns an entry like TranspositionTable.probe, or None
+        offset = self.HEADER.size + key % self.slots * self.RECORD.size
+        storedKey = struct.unpack_from("<Q", self.data, offset)[0]
+        if not storedKey:
+            return None
+        data = self.data[offset + 8:offset + self.RECORD.size]
+        if storedKey ^ self.check(data) != key:
+            return None
+        depth, bound, move, score = self.DATA.unpack(data)
+        return (key, depth, bound, score, move, 0)
+
+    def store(self, key, depth, bound, score, move):
+        # Deeper results for the same position stay, other positions are replaced
+        old = self.probe(key)
+        if old is not None and old[1] > depth:
+            return
+        offset = self.HEADER.size + key % self.slots * self.RECORD.size
+        data = self.DATA.pack(depth, bound, move, score)
+        self.data[offset:offset + self.RECORD.size] = (key ^ self.check(data)).to_bytes(8, "little") + data
+
+    def merge(self, entries):
+        for entry in entries:
+            self.store(entry[0], entry[1], entry[2], entry[3], entry[4])
+
+    def entries(self, minDepth=0):
+        # Every valid entry of at least minDepth
+        for index, (storedKey, depth, bound, move, score) in \
+                enumerate(self.RECORD.iter_unpack(self.data[self.HEADER.size:])):
+            if storedKey and depth >= minDepth:
+                offset = self.HEADER.size + index * self.RECORD.size + 8
+                key = storedKey ^ self.check(self.data[offset:offset + self.DATA.size])
+                if key % self.slots == index:
+                    yield (key, depth, bound, score, move, 0)
+
+
+TABLEBASE_ORDER = "KQRBNP"
+TABLEBASE_CODES = {"K": chess.KING, "Q": chess.QUEEN, "R": chess.ROOK,
+                   "B": chess.BISHOP, "N": chess.KNIGHT, "P": chess.PAWN}
+
+
+def tablebaseStrength(pieces):
+    # More pieces, then stronger pieces, make a side stronger
+    return len(pieces), [-TABLEBASE_ORDER.index(piece) for piece in pieces]
+
+
+class Tablebases():
+    # Distance-to-mate tables built by tablebase.py. Every signature such as
+    # "KQvK" has its own file with one byte per position: 0 for draws, else
+    # the distance to mate in plies plus one. An even distance means the side
+    # to move gets mated, an odd one that it mates. Tables are only stored
+    # with the stronger side as white, other positions are probed mirrored.
+    MAGIC = b"CBTB0001"
+
+    def __init__(self, directory, maxPieces=4):
+        self.directory = directory
+        self.maxPieces = maxPieces
+        self.tables = {}
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+                table[0].close()
+        self.tables = {}
+
+    def getTable(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, signature + ".tb")
+            table = None
+            if os.path.exists(path):
+                file = open(path, "rb")
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                if data[:len(self.MAGIC)] != self.MAGIC:
+                    raise ValueError(f"{path} is not a tablebase file")
+                table = (file, data)
+            self.tables[signature] = table
+        table = self.tables[signature]
+        return None if table is None else table[1]
+
+    def probe(self, position):
+        # Returns the stored value, or None when there is no table for it
+        occupied = position.occupied[0] | position.occupied[1]
+        count = bin(occupied).count("1")
+        if count > self.maxPieces:
+            return None
+        if count == 2:
+            return 0
+        pieces = position.pieces
+        sides = []
+        for color in (chess.WHITE, chess.BLACK):
+            sides.append("".join(piece * bin(pieces[color * 8 + TABLEBASE_CODES[piece]]).count("1")
+                                 for piece in TABLEBASE_ORDER))
+        mirror = tablebaseStrength(sides[0]) < tablebaseStrength(sides[1])
+        if mirror:
+            sides.reverse()
+        data = self.getTable(sides[0] + "v" + sides[1])
+        if data is None:
+            return None
+
+        # Kings first, then the other pieces of the (mirrored) white and black side
+        index = 0
+        for color, letters in ((1, "K"), (0, "K"), (1, sides[0][1:]), (0, sides[1][1:])):
+            realColor = color ^ 1 if mirror else color
+            previous = None
+            for letter in letters:
+                if letter != previous:
+                    bitboard = pieces[realColor * 8 + TABLEBASE_CODES[letter]]
+                    previous = letter
+                bit = bitboard & -bitboard
+                bitboard ^= bit
+                square = bit.bit_length() - 1
+                index = index * 64 + (square ^ 56 if mirror else square)
+        turn = position.turn ^ 1 if mirror else position.turn
+        if turn == 0:
+            index += 64 ** count
+        return data[len(self.MAGIC) + index]
+
+
+def encodeMove(move):
+    if move is None:
+        return 0
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decodeMove(code):
+    if not code:
+        return None
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+# Moves inside the search are plain ints laid out like encodeMove:
+# from_square | to_square << 6 | promotion << 12. Pieces are coded as
+# color * 8 + piece_type, so 0 is an empty square and code ^ 8 flips the color.
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# Castling rights that survive a move from or to the square
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[chess.E1] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[chess.H1] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[chess.A1] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[chess.E8] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[chess.H8] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[chess.A8] = 15 & ~BLACK_QUEENSIDE
+
+PROMOTION_TYPES = (chess.QUEEN, chess.KNIGHT, chess.ROOK, chess.BISHOP)
+
+# Number of slots one move takes on the undo stack
+UNDO_SIZE = 10
+
+
+class Position():
+    # Compact board used inside the search. It keeps integer bitboards per
+    # piece code and color next to a square list, and updates the hash and
+    # the evaluation terms while making moves. Moves are generated
+    # pseudo-legally; makeMove rejects the ones that leave the king in check.
+    __slots__ = ("squares", "pieces", "occupied", "turn", "castling", "ep", "halfmove",
+                 "hash", "material", "middlegame", "endgame", "phase",
+                 "undo", "hashHistory", "stackTop", "maxStack",
+                 "pieceKeys", "sideKey", "castlingKeys", "enPassantKeys",
+                 "materialValues", "middlegameValues", "endgameValues")
+
+    def __init__(self, pieceKeys, sideKey, castlingKeys, enPassantKeys,
+                 materialValues, middlegameValues, endgameValues, maxStack=1024):
+        self.pieceKeys = pieceKeys
+        self.sideKey = sideKey
+        self.castlingKeys = castlingKeys
+        self.enPassantKeys = enPassantKeys
+        self.materialValues = materialValues
+        self.middlegameValues = middlegameValues
+        self.endgameValues = endgameValues
+        self.maxStack = maxStack
+        self.undo = [0] * (maxStack * UNDO_SIZE)
+        self.hashHistory = [0] * maxStack
+        self.setBoard(chess.Board())
+
+    def setBoard(self, board):
+        # Replays the move stack when there is one so repetitions before the
+        # current position are known to the search
+        moves = board.move_stack
+        if moves:
+            root = board.root()
+        else:
+            root = board
+        self.squares = [0] * 64
+        self.pieces = [0] * 16
+        self.occupied = [0, 0]
+        for square, piece in root.piece_map().items():
+            code = piece.color * 8 + piece.piece_type
+            self.squares[square] = code
+            self.pieces[code] |= 1 << square
+            self.occupied[piece.color] |= 1 << square
+        self.turn = int(root.turn)
+        self.castling = 0
+        for rookSquare, right in ((chess.H1, WHITE_KINGSIDE), (chess.A1, WHITE_QUEENSIDE),
+                                  (chess.H8, BLACK_KINGSIDE), (chess.A8, BLACK_QUEENSIDE)):
+            if root.castling_rights & (1 << rookSquare):
+                self.castling |= right
+        self.ep = 0
+        if root.ep_square is not None and root.has_legal_en_passant():
+            self.ep = root.ep_square
+        self.halfmove = root.halfmove_clock
+        self.stackTop = 0
+        self.resetState()
+        for move in moves:
+            self.makeMove(encodeMove(move))
+        if self.stackTop >= self.maxStack // 2:
+            # Keep the recent history only, older positions cannot repeat
+            # past the last irreversible move anyway
+            self.setBoard(chess.Board(board.fen()))
+
+    def setPieces(self, placement, turn):
+        # Quick setup from (code, square) pairs for positions without castling
+        # rights or en passant, as used by the tablebase generator. The hash
+        # and evaluation terms are not recomputed.
+        self.squares = [0] * 64
+        self.pieces = [0] * 16
+        self.occupied = [0, 0]
+        for code, square in placement:
+            self.squares[square] = code
+            self.pieces[code] |= 1 << square
+            self.occupied[code >> 3] |= 1 << square
+        self.turn = turn
+        self.castling = 0
+        self.ep = 0
+        self.halfmove = 0
+        self.stackTop = 0
+
+    def toBoard(self):
+        board = chess.Board(None)
+        for square, code in enumerate(self.squares):
+            if code:
+                board.set_piece_at(square, chess.Piece(code & 7, bool(code >> 3)))
+        board.turn = bool(self.turn)
+        rights = 0
+        for rookSquare, right in ((chess.H1, WHITE_KINGSIDE), (chess.A1, WHITE_QUEENSIDE),
+                                  (chess.H8, BLACK_KINGSIDE), (chess.A8, BLACK_QUEENSIDE)):
+            if self.castling & right:
+                rights |= 1 << rookSquare
+        board.castling_rights = rights
+        board.ep_square = self.ep or None
+        board.halfmove_clock = self.halfmove
+        return board
+
+    def resetState(self):
+        self.hash = self.computeHash()
+        material = 0
+        middlegame = 0
+        endgame = 0
+        phase = 0
+        for square, code in enumerate(self.squares):
+            if code:
+                material += self.materialValues[code]
+                middlegame += self.middlegameValues[code * 64 + square]
+                endgame += self.endgameValues[code * 64 + square]
+                phase += PHASE_WEIGHTS[code & 7]
+        self.material = material
+        self.middlegame = middlegame
+        self.endgame = endgame
+        self.phase = phase
+
+    def computeHash(self):
+        boardHash = 0
+        for square, code in enumerate(self.squares):
+            if code:
+                boardHash ^= self.pieceKeys[code * 64 + square]
+        if not self.turn:
+            boardHash ^= self.sideKey
+        boardHash ^= self.castlingKeys[self.castling]
+        if self.ep:
+            boardHash ^= self.enPassantKeys[self.ep & 7]
+        return boardHash
+
+    def isAttacked(self, square, byColor):
+        pieces = self.pieces
+        base = byColor * 8
+        if chess.BB_KNIGHT_ATTACKS[square] & pieces[base + chess.KNIGHT]:
+            return True
+        if chess.BB_PAWN_ATTACKS[byColor ^ 1][square] & pieces[base + chess.PAWN]:
+            return True
+        if chess.BB_KING_ATTACKS[square] & pieces[base + chess.KING]:
+            return True
+        occupied = self.occupied[0] | self.occupied[1]
+        queens = pieces[base + chess.QUEEN]
+        if chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & (pieces[base + chess.BISHOP] | queens):
+            return True
+        return bool((chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                     chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]) &
+                    (pieces[base + chess.ROOK] | queens))
+
+    def hasLegalEnPassant(self, epSquare, color):
+        # Tries every capture on epSquare by color's pawns on the bitboards and
+        # checks that the king is safe afterwards, a pinned pawn cannot take
+        pieces = self.pieces
+        occupied = self.occupied
+        pawn = color * 8 + chess.PAWN
+        theirPawn = pawn ^ 8
+        epBit = 1 << epSquare
+        capturedBit = epBit >> 8 if color else epBit << 8
+        king = pieces[color * 8 + chess.KING].bit_length() - 1
+        pieces[theirPawn] ^= capturedBit
+        occupied[color ^ 1] ^= capturedBit
+        legal = False
+        for square in chess.scan_forward(chess.BB_PAWN_ATTACKS[color ^ 1][epSquare] & pieces[pawn]):
+            bits = (1 << square) | epBit
+            pieces[pawn] ^= bits
+            occupied[color] ^= bits
+            legal = not self.isAttacked(king, color ^ 1)
+            pieces[pawn] ^= bits
+            occupied[color] ^= bits
+            if legal:
+                break
+        pieces[theirPawn] ^= capturedBit
+        occupied[color ^ 1] ^= capturedBit
+        return legal
+
+    def inCheck(self):
+        return self.isAttacked(self.pieces[self.turn * 8 + chess.KING].bit_length() - 1, self.turn ^ 1)
+
+    def makeMove(self, move):
+        # Returns False, with the move already taken back, if it leaves the
+        # own king in check
+        fromSquare = move & 63
+        toSquare = move >> 6 & 63
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        pieceKeys = self.pieceKeys
+        middlegameValues = self.middlegameValues
+        endgameValues = self.endgameValues
+        us = self.turn
+        code = squares[fromSquare]
+        captured = squares[toSquare]
+
+        undo = self.undo
+        top = self.stackTop
+        base = top * UNDO_SIZE
+        undo[base] = move
+        undo[base + 1] = captured
+        undo[base + 2] = self.castling
+        undo[base + 3] = self.ep
+        undo[base + 4] = self.halfmove
+        undo[base + 5] = self.hash
+        undo[base + 6] = self.material
+        undo[base + 7] = self.middlegame
+        undo[base + 8] = self.endgame
+        undo[base + 9] = self.phase
+        self.hashHistory[top] = self.hash
+        self.stackTop = top + 1
+
+        boardHash = self.hash ^ self.sideKey
+        ep = self.ep
+        if ep:
+            boardHash ^= self.enPassantKeys[ep & 7]
+        middlegame = self.middlegame
+        endgame = self.endgame
+        halfmove = self.halfmove + 1
+        fromBit = 1 << fromSquare
+        toBit = 1 << toSquare
+
+        if captured:
+            pieces[captured] ^= toBit
+            occupied[us ^ 1] ^= toBit
+            index = captured * 64 + toSquare
+            boardHash ^= pieceKeys[index]
+            middlegame -= middlegameValues[index]
+            endgame -= endgameValues[index]
+            self.material -= self.materialValues[captured]
+            self.phase -= PHASE_WEIGHTS[captured & 7]
+            halfmove = 0
+
+        pieces[code] ^= fromBit | toBit
+        occupied[us] ^= fromBit | toBit
+        squares[fromSquare] = 0
+        squares[toSquare] = code
+        fromIndex = code * 64 + fromSquare
+        toIndex = code * 64 + toSquare
+        boardHash ^= pieceKeys[fromIndex] ^ pieceKeys[toIndex]
+        middlegame += middlegameValues[toIndex] - middlegameValues[fromIndex]
+        endgame += endgameValues[toIndex] - endgameValues[fromIndex]
+
+        newEp = 0
+        pieceType = code & 7
+        if pieceType == chess.PAWN:
+            halfmove = 0
+            if toSquare == ep and ep:
+                capturedSquare = toSquare - 8 if us else toSquare + 8
+                capturedCode = code ^ 8
+                capturedBit = 1 << capturedSquare
+                pieces[capturedCode] ^= capturedBit
+                occupied[us ^ 1] ^= capturedBit
+                squares[capturedSquare] = 0
+                index = capturedCode * 64 + capturedSquare
+                boardHash ^= pieceKeys[index]
+                middlegame -= middlegameValues[index]
+                endgame -= endgameValues[index]
+                self.material -= self.materialValues[capturedCode]
+            elif toSquare - fromSquare == 16 or fromSquare - toSquare == 16:
+                # Like a FEN, only remember the square when a pawn can legally
+                # take there, so transpositions get the same hash
+                if chess.BB_PAWN_ATTACKS[us][(fromSquare + toSquare) >> 1] & pieces[(us ^ 1) * 8 + chess.PAWN] and \
+                        self.hasLegalEnPassant((fromSquare + toSquare) >> 1, us ^ 1):
+                    newEp = (fromSquare + toSquare) >> 1
+                    boardHash ^= self.enPassantKeys[newEp & 7]
+            elif move >> 12:
+                promoted = us * 8 + (move >> 12)
+                pieces[code] ^= toBit
+                pieces[promoted] |= toBit
+                squares[toSquare] = promoted
+                index = promoted * 64 + toSquare
+                boardHash ^= pieceKeys[toIndex] ^ pieceKeys[index]
+                middlegame += middlegameValues[index] - middlegameValues[toIndex]
+                endgame += endgameValues[index] - endgameValues[toIndex]
+                self.material += self.materialValues[promoted] - self.materialValues[code]
+                self.phase += PHASE_WEIGHTS[move >> 12]
+        elif pieceType == chess.KING and (toSquare - fromSquare == 2 or fromSquare - toSquare == 2):
+            if toSquare > fromSquare:
+                rookFrom, rookTo = toSquare + 1, toSquare - 1
+            else:
+                rookFrom, rookTo = toSquare - 2, toSquare + 1
+            rook = us * 8 + chess.ROOK
+            rookBits = (1 << rookFrom) | (1 << rookTo)
+            pieces[rook] ^= rookBits
+            occupied[us] ^= rookBits
+            squares[rookFrom] = 0
+            squares[rookTo] = rook
+            fromIndex = rook * 64 + rookFrom
+            toIndex = rook * 64 + rookTo
+            boardHash ^= pieceKeys[fromIndex] ^ pieceKeys[toIndex]
+            middlegame += middlegameValues[toIndex] - middlegameValues[fromIndex]
+            endgame += endgameValues[toIndex] - endgameValues[fromIndex]
+
+        castling = self.castling
+        if castling:
+            newCastling = castling & CASTLING_MASKS[fromSquare] & CASTLING_MASKS[toSquare]
+            if newCastling != castling:
+                boardHash ^= self.castlingKeys[castling] ^ self.castlingKeys[newCastling]
+                self.castling = newCastling
+
+        self.ep = newEp
+        self.halfmove = halfmove
+        self.hash = boardHash
+        self.middlegame = middlegame
+        self.endgame = endgame
+        self.turn = us ^ 1
+
+        if self.isAttacked(pieces[us * 8 + chess.KING].bit_length() - 1, us ^ 1):
+            self.unmakeMove()
+            return False
+        return True
+
+    def unmakeMove(self):
+        top = self.stackTop - 1
+        self.stackTop = top
+        undo = self.undo
+        base = top * UNDO_SIZE
+        move = undo[base]
+        captured = undo[base + 1]
+        self.castling = undo[base + 2]
+        ep = undo[base + 3]
+        self.ep = ep
+        self.halfmove = undo[base + 4]
+        self.hash = undo[base + 5]
+        self.material = undo[base + 6]
+        self.middlegame = undo[base + 7]
+        self.endgame = undo[base + 8]
+        self.phase = undo[base + 9]
+        us = self.turn ^ 1
+        self.turn = us
+
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        fromSquare = move & 63
+        toSquare = move >> 6 & 63
+        fromBit = 1 << fromSquare
+        toBit = 1 << toSquare
+        code = squares[toSquare]
+        if move >> 12:
+            pieces[code] ^= toBit
+            code = us * 8 + chess.PAWN
+            pieces[code] |= toBit
+        pieces[code] ^= fromBit | toBit
+        occupied[us] ^= fromBit | toBit
+        squares[fromSquare] = code
+        squares[toSquare] = captured
+        if captured:
+            pieces[captured] |= toBit
+            occupied[us ^ 1] |= toBit
+        else:
+            pieceType = code & 7
+            if pieceType == chess.PAWN and toSquare == ep and ep:
+                capturedSquare = toSquare - 8 if us else toSquare + 8
+                capturedBit = 1 << capturedSquare
+                pieces[code ^ 8] |= capturedBit
+                occupied[us ^ 1] |= capturedBit
+                squares[capturedSquare] = code ^ 8
+            elif pieceType == chess.KING and (toSquare - fromSquare == 2 or fromSquare - toSquare == 2):
+                if toSquare > fromSquare:
+                    rookFrom, rookTo = toSquare + 1, toSquare - 1
+                else:
+                    rookFrom, rookTo = toSquare - 2, toSquare + 1
+                rook = us * 8 + chess.ROOK
+                rookBits = (1 << rookFrom) | (1 << rookTo)
+                pieces[rook] ^= rookBits
+                occupied[us] ^= rookBits
+                squares[rookTo] = 0
+                squares[rookFrom] = rook
+
+    def makeNullMove(self):
+        # Passes the turn. Stored with move 0, which no real move encodes to.
+        undo = self.undo
+        top = self.stackTop
+        base = top * UNDO_SIZE
+        undo[base] = 0
+        undo[base + 3] = self.ep
+        undo[base + 4] = self.halfmove
+        undo[base + 5] = self.hash
+        self.hashHistory[top] = self.hash
+        self.stackTop = top + 1
+        boardHash = self.hash ^ self.sideKey
+        if self.ep:
+            boardHash ^= self.enPassantKeys[self.ep & 7]
+            self.ep = 0
+        self.hash = boardHash
+        # No repetition can reach back past a null move
+        self.halfmove = 0
+        self.turn ^= 1
+
+    def unmakeNullMove(self):
+        top = self.stackTop - 1
+        self.stackTop = top
+        base = top * UNDO_SIZE
+        self.ep = self.undo[base + 3]
+        self.halfmove = self.undo[base + 4]
+        self.hash = self.undo[base + 5]
+        self.turn ^= 1
+
+    def unwindTo(self, stackTop):
+        # Takes back real and null moves alike, used when a search is aborted
+        while self.stackTop > stackTop:
+            if self.undo[(self.stackTop - 1) * UNDO_SIZE]:
+                self.unmakeMove()
+            else:
+                self.unmakeNullMove()
+
+    def attackersTo(self, square, occupied):
+        # Pieces of both colors attacking square, with sliders seeing through
+        # everything that is not in occupied
+        pieces = self.pieces
+        queens = pieces[chess.QUEEN] | pieces[8 + chess.QUEEN]
+        return ((chess.BB_KNIGHT_ATTACKS[square] & (pieces[chess.KNIGHT] | pieces[8 + chess.KNIGHT])) |
+                (chess.BB_KING_ATTACKS[square] & (pieces[chess.KING] | pieces[8 + chess.KING])) |
+                (chess.BB_PAWN_ATTACKS[chess.WHITE][square] & pieces[chess.PAWN]) |
+                (chess.BB_PAWN_ATTACKS[chess.BLACK][square] & pieces[8 + chess.PAWN]) |
+                (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] &
+                 (pieces[chess.BISHOP] | pieces[8 + chess.BISHOP] | queens)) |
+                ((chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                  chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]) &
+                 (pieces[chess.ROOK] | pieces[8 + chess.ROOK] | queens))) & occupied
+
+    def see(self, move):
+        # Static exchange evaluation: the material the side to move wins with
+        # the capture when both sides keep recapturing with their least
+        # valuable attacker and may stop whenever that is better for them
+        fromSquare = move & 63
+        toSquare = move >> 6 & 63
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied[0] | self.occupied[1]
+        captured = squares[toSquare] & 7
+        if not captured:
+            # En passant
+            captured = chess.PAWN
+            occupied ^= 1 << (toSquare - 8 if self.turn else toSquare + 8)
+        gain = [SEE_VALUES[captured]]
+        attacker = squares[fromSquare] & 7
+        occupied ^= 1 << fromSquare
+        side = self.turn ^ 1
+        while True:
+            # Speculative: what the side to move would win if side takes back
+            gain.append(SEE_VALUES[attacker] - gain[-1])
+            if max(-gain[-2], gain[-1]) < 0:
+                break
+            attackers = self.attackersTo(toSquare, occupied) & self.occupied[side]
+            if not attackers:
+                break
+            for attacker in range(chess.PAWN, chess.KING + 1):
+                candidates = attackers & pieces[side * 8 + attacker]
+                if candidates:
+                    break
+            occupied ^= candidates & -candidates
+            side ^= 1
+        # The last capture never happened, work back from the one before it
+        gain.pop()
+        for d in range(len(gain) - 1, 0, -1):
+            gain[d - 1] = -max(-gain[d - 1], gain[d])
+        return gain[0]
+
+    def hasPieces(self):
+        # Whether the side to move has anything besides pawns and the king
+        pieces = self.pieces
+        base = self.turn * 8
+        return bool(pieces[base + chess.KNIGHT] | pieces[base + chess.BISHOP] |
+                    pieces[base + chess.ROOK] | pieces[base + chess.QUEEN])
+
+    def generateNoisy(self, moves):
+        # Captures, en passant and all promotions
+        append = moves.append
+        us = self.turn
+        pieces = self.pieces
+        enemy = self.occupied[us ^ 1]
+        occupied = self.occupied[us] | enemy
+        base = us * 8
+
+        pawns = pieces[base + chess.PAWN]
+        if us:
+            left = (pawns & ~chess.BB_FILE_A) << 7 & enemy
+            right = (pawns & ~chess.BB_FILE_H) << 9 & enemy
+            pushes = pawns << 8 & ~occupied & chess.BB_RANK_8
+            promotionRank = chess.BB_RANK_8
+            leftShift, rightShift, pushShift = 7, 9, 8
+        else:
+            left = (pawns & ~chess.BB_FILE_H) >> 7 & enemy
+            right = (pawns & ~chess.BB_FILE_A) >> 9 & enemy
+            pushes = pawns >> 8 & ~occupied & chess.BB_RANK_1
+            promotionRank = chess.BB_RANK_1
+            leftShift, rightShift, pushShift = -7, -9, -8
+        for targets, shift in ((left, leftShift), (right, rightShift), (pushes, pushShift)):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                toSquare = bit.bit_length() - 1
+                move = toSquare - shift | toSquare << 6
+                if bit & promotionRank:
+                    for promotion in PROMOTION_TYPES:
+                        append(move | promotion << 12)
+                else:
+                    append(move)
+        if self.ep:
+            attackers = chess.BB_PAWN_ATTACKS[us ^ 1][self.ep] & pawns
+            while attackers:
+                bit = attackers & -attackers
+                attackers ^= bit
+                append(bit.bit_length() - 1 | self.ep << 6)
+
+        self.generatePieceMoves(moves, enemy, occupied)
+
+    def generateQuiets(self, moves):
+        # Everything generateNoisy leaves out, including castling
+        append = moves.append
+        us = self.turn
+        pieces = self.pieces
+        occupied = self.occupied[0] | self.occupied[1]
+        empty = ~occupied
+        base = us * 8
+
+        pawns = pieces[base + chess.PAWN]
+        if us:
+            single = pawns << 8 & empty
+            double = (single & chess.BB_RANK_3) << 8 & empty
+            single &= ~chess.BB_RANK_8
+            singleShift, doubleShift = 8, 16
+        else:
+            single = pawns >> 8 & empty
+            double = (single & chess.BB_RANK_6) >> 8 & empty
+            single &= ~chess.BB_RANK_1
+            singleShift, doubleShift = -8, -16
+        for targets, shift in ((single, singleShift), (double, doubleShift)):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                toSquare = bit.bit_length() - 1
+                append(toSquare - shift | toSquare << 6)
+
+        self.generatePieceMoves(moves, empty & chess.BB_ALL, occupied)
+
+        castling = self.castling
+        if castling:
+            them = us ^ 1
+            if us:
+                if castling & WHITE_KINGSIDE and not occupied & (chess.BB_F1 | chess.BB_G1) and \
+                        not self.isAttacked(chess.E1, them) and not self.isAttacked(chess.F1, them):
+                    append(chess.E1 | chess.G1 << 6)
+                if castling & WHITE_QUEENSIDE and not occupied & (chess.BB_B1 | chess.BB_C1 | chess.BB_D1) and \
+                        not self.isAttacked(chess.E1, them) and not self.isAttacked(chess.D1, them):
+                    append(chess.E1 | chess.C1 << 6)
+            else:
+                if castling & BLACK_KINGSIDE and not occupied & (chess.BB_F8 | chess.BB_G8) and \
+                        not self.isAttacked(chess.E8, them) and not self.isAttacked(chess.F8, them):
+                    append(chess.E8 | chess.G8 << 6)
+                if castling & BLACK_QUEENSIDE and not occupied & (chess.BB_B8 | chess.BB_C8 | chess.BB_D8) and \
+                        not self.isAttacked(chess.E8, them) and not self.isAttacked(chess.D8, them):
+                    append(chess.E8 | chess.C8 << 6)
+
+    def generatePieceMoves(self, moves, targets, occupied):
+        append = moves.append
+        pieces = self.pieces
+        base = self.turn * 8
+        queens = pieces[base + chess.QUEEN]
+        for attacks, masks, bitboard in ((chess.BB_KNIGHT_ATTACKS, None, pieces[base + chess.KNIGHT]),
+                                         (chess.BB_DIAG_ATTACKS, chess.BB_DIAG_MASKS, pieces[base + chess.BISHOP] | queens),
+                                         (chess.BB_RANK_ATTACKS, chess.BB_RANK_MASKS, pieces[base + chess.ROOK] | queens),
+                                         (chess.BB_FILE_ATTACKS, chess.BB_FILE_MASKS, pieces[base + chess.ROOK] | queens),
+                                         (chess.BB_KING_ATTACKS, None, pieces[base + chess.KING])):
+            while bitboard:
+                bit = bitboard & -bitboard
+                bitboard ^= bit
+                fromSquare = bit.bit_length() - 1
+                if masks is None:
+                    destinations = attacks[fromSquare] & targets
+                else:
+                    destinations = attacks[fromSquare][masks[fromSquare] & occupied] & targets
+                while destinations:
+                    bit = destinations & -destinations
+                    destinations ^= bit
+                    append(fromSquare | (bit.bit_length() - 1) << 6)
+
+    def generateMoves(self):
+        moves = []
+        self.generateNoisy(moves)
+        self.generateQuiets(moves)
+        return moves
+
+    def hasLegalMove(self):
+        for move in self.generateMoves():
+            if self.makeMove(move):
+                self.unmakeMove()
+                return True
+        return False
+
+    def isPseudoLegal(self, move):
+        # Cheap validation of moves that come from the hash table or the
+        # killer slots and were not generated for this position
+        fromSquare = move & 63
+        toSquare = move >> 6 & 63
+        promotion = move >> 12
+        code = self.squares[fromSquare]
+        us = self.turn
+        if not code or code >> 3 != us:
+            return False
+        target = self.squares[toSquare]
+        if target and target >> 3 == us:
+            return False
+        pieceType = code & 7
+        occupied = self.occupied[0] | self.occupied[1]
+        toBit = 1 << toSquare
+        if pieceType == chess.PAWN:
+            if bool(toBit & chess.BB_BACKRANKS) != bool(promotion) or promotion not in (0,) + PROMOTION_TYPES:
+                return False
+            if chess.BB_PAWN_ATTACKS[us][fromSquare] & toBit:
+                return bool(target) or (toSquare == self.ep and self.ep != 0)
+            step = 8 if us else -8
+            if target:
+                return False
+            if toSquare == fromSquare + step:
+                return True
+            startRank = chess.BB_RANK_2 if us else chess.BB_RANK_7
+            return toSquare == fromSquare + 2 * step and bool((1 << fromSquare) & startRank) and \
+                not self.squares[fromSquare + step]
+        if promotion:
+            return False
+        if pieceType == chess.KNIGHT:
+            return bool(chess.BB_KNIGHT_ATTACKS[fromSquare] & toBit)
+        if pieceType == chess.KING:
+            if chess.BB_KING_ATTACKS[fromSquare] & toBit:
+                return True
+            castles = []
+            self.generateQuiets(castles)
+            return move in castles
+        attacks = 0
+        if pieceType != chess.ROOK:
+            attacks |= chess.BB_DIAG_ATTACKS[fromSquare][chess.BB_DIAG_MASKS[fromSquare] & occupied]
+        if pieceType != chess.BISHOP:
+            attacks |= chess.BB_RANK_ATTACKS[fromSquare][chess.BB_RANK_MASKS[fromSquare] & occupied] | \
+                chess.BB_FILE_ATTACKS[fromSquare][chess.BB_FILE_MASKS[fromSquare] & occupied]
+        return bool(attacks & toBit)
+
+    def isCapture(self, move):
+        toSquare = move >> 6 & 63
+        return bool(self.squares[toSquare]) or \
+            (toSquare == self.ep and self.ep != 0 and self.squares[move & 63] & 7 == chess.PAWN)
+
+    def isRepetition(self):
+        # Only positions since the last capture or pawn move, with the same
+        # side to move, can be equal to the current one
+        boardHash = self.hash
+        history = self.hashHistory
+        index = self.stackTop - 2
+        stop = self.stackTop - self.halfmove
+        if stop < 0:
+            stop = 0
+        while index >= stop:
+            if history[index] == boardHash:
+                return True
+            index -= 2
+        return False
+
+    def isInsufficientMaterial(self):
+        pieces = self.pieces
+        if pieces[chess.PAWN] | pieces[8 + chess.PAWN] | pieces[chess.ROOK] | pieces[8 + chess.ROOK] | \
+                pieces[chess.QUEEN] | pieces[8 + chess.QUEEN]:
+            return False
+        minors = pieces[chess.KNIGHT] | pieces[8 + chess.KNIGHT] | pieces[chess.BISHOP] | pieces[8 + chess.BISHOP]
+        return minors & (minors - 1) == 0
+
+    def isDraw(self):
+        return self.halfmove >= 100 or self.isRepetition() or self.isInsufficientMaterial()
+
+
+class SearchState():
+    # Buffers the search reuses at every node instead of allocating new ones.
+    # pv is a triangular table: the line found at a ply starts at
+    # pv[ply][ply] and ends before pvLength[ply]. noisy and quiets hold the
+    # moves of each generation stage per ply.
+    __slots__ = ("pv", "pvLength", "noisy", "quiets", "killers")
+
+    def __init__(self, maxPly=MAX_PLY):
+        self.pv = [[0] * maxPly for _ in range(maxPly)]
+        self.pvLength = [0] * maxPly
+        self.noisy = [[] for _ in range(maxPly)]
+        self.quiets = [[] for _ in range(maxPly)]
+        self.killers = [[0, 0] for _ in range(maxPly)]
+
+    def clearKillers(self):
+        for killers in self.killers:
+            killers[0] = 0
+            killers[1] = 0
+
+    def line(self):
+        return self.pv[0][:self.pvLength[0]]
+
+
+def createZobristKeys(seed):
+    # Implemented according to https://www.chessprogramming.org/Zobrist_Hashing
+    # And https://en.wikipedia.org/wiki/Zobrist_hashing
+    # The keys come from a seeded generator so hashes are the same in every
+    # process and can be stored on disk, e.g. in the opening book. Returns
+    # (pieceKeys, sideKey, castlingKeys, enPassantKeys) as Position takes them.
+    generator = random.Random(seed)
+    pieceKeys = [0] * (16 * 64)
+    for color in [chess.BLACK, chess.WHITE]:
+        for pieceType in chess.PIECE_TYPES:
+            for square in range(64):
+                pieceKeys[(color * 8 + pieceType) * 64 + square] = generator.getrandbits(64)
+    sideKey = generator.getrandbits(64)
+    queenCastleKeys = [generator.getrandbits(64), generator.getrandbits(64)]
+    kingCastleKeys = [generator.getrandbits(64), generator.getrandbits(64)]
+    # Indexed by the file of the en passant square
+    enPassantKeys = tuple(generator.getrandbits(64) for _ in range(8))
+    # One key per combination of castling rights
+    castlingKeys = [0] * 16
+    for rights in range(16):
+        for right, key in ((WHITE_KINGSIDE, kingCastleKeys[chess.WHITE]),
+                           (WHITE_QUEENSIDE, queenCastleKeys[chess.WHITE]),
+                           (BLACK_KINGSIDE, kingCastleKeys[chess.BLACK]),
+                           (BLACK_QUEENSIDE, queenCastleKeys[chess.BLACK])):
+            if rights & right:
+                castlingKeys[rights] ^= key
+    return tuple(pieceKeys), sideKey, tuple(castlingKeys), enPassantKeys
+
+
+# Keys by seed, built once per process and shared by all of its bots
+ZOBRIST_KEYS = {}
+
+
+def zobristKeys(seed=ZOBRIST_SEED):
+    keys = ZOBRIST_KEYS.get(seed)
+    if keys is None:
+        keys = ZOBRIST_KEYS[seed] = createZobristKeys(seed)
+    return keys
+
+
+def createPieceSquareTables():
+    # Tables are written as seen from white's side of the board: the first
+    # row is the eighth rank and the last row is the first rank
+    # Pawns
+    pawnTable = [[100, 100, 100, 100, 100, 100, 100, 100],
+                 [90, 85, 85, 92, 92, 85, 85, 90],
+                 [80, 80, 80, 88, 88, 80, 80, 80],
+                 [70, 70, 70, 84, 84, 70, 70, 70],
+                 [50, 60, 60, 80, 80, 30, 30, 50],
+                 [40, 30, 50, 50, 50, 20, 30, 40],
+                 [90, 90, 90, 30, 30, 90, 90, 90],
+                 [0, 0, 0, 0, 0, 0, 0, 0]]
+    
+    knightTable = [[20, 40, 40, 40, 40, 40, 40, 20],
+                  [40, 50, 50, 60, 60, 50, 50, 40],
+                  [40, 50, 100, 100, 100, 100, 50, 40],
+                  [40, 50, 100, 100, 100, 100, 50, 40],
+                  [40, 50, 100, 100, 100, 100, 50, 40],
+                  [40, 50, 100, 100, 100, 100, 50, 40],
+                  [40, 50, 50, 60, 60, 50, 50, 40],
+                  [20, 40, 40, 40, 40, 40, 40, 20]]
+    
+    emptyTable = [[100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100],
+                  [100, 100, 100, 100, 100, 100, 100, 100]]
+
+    # Without the middlegame dangers the king belongs in the center
+    kingEndgameTable = [[40, 50, 60, 70, 70, 60, 50, 40],
+                        [50, 60, 70, 80, 80, 70, 60, 50],
+                        [60, 70, 90, 100, 100, 90, 70, 60],
+                        [70, 80, 100, 110, 110, 100, 80, 70],
+                        [70, 80, 100, 110, 110, 100, 80, 70],
+                        [60, 70, 90, 100, 100, 90, 70, 60],
+                        [50, 60, 70, 80, 80, 70, 60, 50],
+                        [40, 50, 60, 70, 70, 60, 50, 40]]
+
+    middlegameTables = {chess.PAWN: pawnTable, chess.KNIGHT: knightTable,
+                        chess.BISHOP: emptyTable, chess.ROOK: emptyTable,
+                        chess.QUEEN: emptyTable, chess.KING: emptyTable}
+    endgameTables = dict(middlegameTables)
+    endgameTables[chess.KING] = kingEndgameTable
+
+    return flattenTables(middlegameTables), flattenTables(endgameTables)
+
+
+def flattenTables(tables):
+    # Turns the 8x8 tables into one flat tuple with 64 entries per piece
+    # code, indexed by (color * 8 + pieceType) * 64 + square. Black's values
+    # are mirrored and negated so that every entry can simply be added to
+    # the white-minus-black score.
+    flatTables = [0] * (16 * 64)
+    for pieceType, table in tables.items():
+        for square in range(64):
+            rank = chess.square_rank(square)
+            file = chess.square_file(square)
+            flatTables[(8 + pieceType) * 64 + square] = table[7 - rank][file] / 3000
+            flatTables[pieceType * 64 + square] = -table[rank][file] / 3000
+    return tuple(flatTables)
+
+
+# The defaults are built at import, so bots never build them again and
+# forked worker processes inherit them
+zobristKeys(ZOBRIST_SEED)
+PIECE_SQUARE_TABLES = createPieceSquareTables()
+
+
 # keep the bot named ChessBot when submitting
-class ChessBot(ChessBotClass):
-    def __init__(self, maxDepth=5, iterate=True):
+class ChessBot(IncrementalBotClass):
+    uses_clock = True
+    # Number of moves the remaining time is spread over in sudden death
+    expectedMovesToGo = 30
+    # Time kept in reserve for overhead outside the search (seconds)
+    safetyMargin = 0.05
+    # The search checks the clock and stop event after this many nodes, minus
+    # one; ponder processes check more often so they stop quickly
+    checkMask = 1023
+
+    def __init__(self, maxDepth=5, iterate=True, hashSizeMB=32, workers=1, bookPath=None, zobristSeed=ZOBRIST_SEED,
+                 tablebasePath=None, ponder=False, cachePath=None, evalPath=None):
         #self.board = chess.Board("r4rk1/2p2pp1/2p4p/p3q2b/1p2P3/P6P/1PP1NPP1/R2Q1RK1 w - - 1 17")
         self.board = chess.Board()
         self.pieceValues = {chess.PAWN: 1, chess.KNIGHT: 3,
@@ -23,373 +1248,879 @@ class ChessBot(ChessBotClass):
                             chess.QUEEN: 9, chess.KING: 0}
         self.maxDepth = maxDepth
         self.currentDepth = 0
-        self.checkers = []
-        self.pastPositions = []
-        self.initializeZobristHashNumbers()
-        self.zobristHash = self.getZobristHash()
-        self.skips = 0
-        self.materialBalance = 0
-        self.pieceSquareTables = self.getPieceSquareTables()
+        self.hashSizeMB = hashSizeMB
+        # A pondering bot hands its deeper entries to the ponder process on
+        # every move, so the table collects them as they are stored
+        self.transpositionTable = TranspositionTable(hashSizeMB, shareDepth=SHARE_DEPTH if ponder else None)
+        self.zobristSeed = zobristSeed
+        # Piece values and tables fitted by tuner.py replace the hand-written ones
+        self.evalPath = evalPath
+        if evalPath:
+            self.middlegameTables, self.endgameTables = self.loadEvaluation(evalPath)
+        else:
+            self.middlegameTables, self.endgameTables = PIECE_SQUARE_TABLES
+        self.position = self.createPosition()
         self.bestLine = []
-        self.lineIDX = 0
+        self.state = SearchState()
+        # Indexed by color * 4096 + from_square * 64 + to_square
+        self.history = [0] * 8192
         self.iterate = iterate
-        #print(self.zobristHash)
+        self.resetCounters()
+        # Statistics of every finished iteration of the last search, and the
+        # summary of the last move. onIteration and onMove are optional
+        # callbacks that get the same dictionaries as soon as they exist.
+        self.iterationStats = []
+        self.lastSearchStats = None
+        self.onIteration = None
+        self.onMove = None
+        self.softDeadline = None
+        self.hardDeadline = None
+        # Set in ponder processes, stops the search when set
+        self.stopEvent = None
+        # Stops the search after about this many nodes when set
+        self.nodeLimit = None
+        # With ponder the expected reply is searched in a background process
+        # while the opponent thinks, see startPondering
+        self.ponder = ponder
+        self.ponderProcess = None
+        self.ponderConnection = None
+        self.ponderStop = None
+        self.ponderMove = None
+        self.ponderHit = False
+        self.ponderFinished = False
+        self.ponderStats = []
+        # Seconds it takes to start and to stop pondering, measured on every
+        # move and kept out of the time for the search
+        self.ponderStartTime = PONDER_START_TIME
+        self.ponderStopTime = PONDER_STOP_TIME
+        # With more than one worker the root moves are split over a process pool
+        self.workers = workers
+        self.pool = None
+        self.rootMoves = None
+        self.book = OpeningBook(bookPath, zobristSeed) if bookPath else None
+        self.tablebasePath = tablebasePath
+        self.tablebases = Tablebases(tablebasePath) if tablebasePath else None
+        # Results shared through a file with other processes and later runs.
+        # What is in it already warms up the transposition table.
+        self.cachePath = cachePath
+        self.positionCache = None
+        if cachePath:
+            self.positionCache = PositionCache(cachePath, zobristSeed)
+            self.transpositionTable.merge(self.positionCache.entries(CACHE_MIN_DEPTH))
 
-    def __call__(self, board_fen = None):
+    def close(self):
+        if self.ponderProcess is not None:
+            self.stopPondering()
+            self.ponderConnection.send(None)
+            self.ponderProcess.join(1)
+            self.ponderProcess.terminate()
+            self.ponderProcess = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebases is not None:
+            self.tablebases.close()
+            self.tablebases = None
+        if self.positionCache is not None:
+            self.positionCache.close()
+            self.positionCache = None
+
+    def __call__(self, board_fen = None, clock=None):
         if board_fen:
             self.board = chess.Board(board_fen)
-            self.zobristHash = self.getZobristHash()
-        evaluation, ret = self.findMoveRecursive(self.maxDepth, iterate=self.iterate)
-        '''print("Skips: ", self.skips)
-        print("Evaluation: ", evaluation)'''
-        return ret
-        
-        
-    def getPieceSquareTables(self):
-        pieceSquareTables = {}
-        # Pawns
-        pawnTable = [[100, 100, 100, 100, 100, 100, 100, 100],
-                     [90, 85, 85, 92, 92, 85, 85, 90],
-                     [80, 80, 80, 88, 88, 80, 80, 80],
-                     [70, 70, 70, 84, 84, 70, 70, 70],
-                     [50, 60, 60, 80, 80, 30, 30, 50],
-                     [40, 30, 50, 50, 50, 20, 30, 40],
-                     [90, 90, 90, 30, 30, 90, 90, 90],
-                     [0, 0, 0, 0, 0, 0, 0, 0]]
-        
-        knightTable = [[20, 40, 40, 40, 40, 40, 40, 20],
-                      [40, 50, 50, 60, 60, 50, 50, 40],
-                      [40, 50, 100, 100, 100, 100, 50, 40],
-                      [40, 50, 100, 100, 100, 100, 50, 40],
-                      [40, 50, 100, 100, 100, 100, 50, 40],
-                      [40, 50, 100, 100, 100, 100, 50, 40],
-                      [40, 50, 50, 60, 60, 50, 50, 40],
-                      [20, 40, 40, 40, 40, 40, 40, 20]]
-        
-        emptyTable = [[100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100],
-                      [100, 100, 100, 100, 100, 100, 100, 100]]
-                      
-        for i in range(8):
-            for j in range(8):
-                pawnTable[i][j] = pawnTable[i][j] / 3000
-                emptyTable[i][j] = emptyTable[i][j] / 3000
-                knightTable[i][j] = knightTable[i][j] / 3000
-        
-        pieceSquareTables[chess.PAWN] = pawnTable
-        pieceSquareTables[chess.BISHOP] = emptyTable
-        pieceSquareTables[chess.KNIGHT] = knightTable
-        pieceSquareTables[chess.ROOK] = emptyTable
-        pieceSquareTables[chess.QUEEN] = emptyTable
-        pieceSquareTables[chess.KING] = emptyTable
+        # The search runs on the compact position, python-chess objects are
+        # only used to talk to the outside world
+        self.stopPondering()
+        self.position.setBoard(self.board)
+        return self.searchMove(clock)
+
+    def new_game(self, board_fen=None):
+        self.stopPondering()
+        self.board = chess.Board(board_fen) if board_fen else chess.Board()
+        self.position.setBoard(self.board)
+        self.transpositionTable.clear()
+        self.state.clearKillers()
+        self.history = [0] * 8192
+
+    def push_move(self, move):
+        if self.ponderMove is not None:
+            if move == self.ponderMove:
+                self.ponderHit = True
+            else:
+                self.stopPondering()
+        self.playMove(move)
+
+    def playMove(self, move):
+        # The position keeps its hash history, so repetitions over the whole
+        # game are seen, and the transposition table carries over to the next
+        # search
+        self.board.push(move)
+        if self.position.stackTop >= self.position.maxStack // 2:
+            self.position.setBoard(self.board)
+        else:
+            self.position.makeMove(encodeMove(move))
+
+    def go(self, clock=None):
+        if self.ponderMove is not None and self.ponderHit:
+            move = self.finishPondering(clock)
+        else:
+            self.stopPondering()
+            move = self.searchMove(clock)
+        self.playMove(move)
+        if self.ponder:
+            self.startPondering()
+        return move
+
+    def startPondering(self):
+        # Searches the reply predicted by the principal variation in a
+        # background process, which gets the deeper part of our table. Only a
+        # principal variation that starts with the move just played will do.
+        if len(self.bestLine) < 2 or decodeMove(self.bestLine[0]) != self.board.peek():
+            return
+        start = time.perf_counter()
+        board = self.board.copy()
+        predicted = decodeMove(self.bestLine[1])
+        if not board.is_legal(predicted):
+            return
+        board.push(predicted)
+        if board.is_game_over():
+            return
+        if self.ponderProcess is None:
+            self.ponderConnection, workerConnection = multiprocessing.Pipe()
+            self.ponderStop = multiprocessing.Event()
+            process = multiprocessing.Process(target=ponderWorker, daemon=True,
+                                              args=(workerConnection, self.ponderStop, self.hashSizeMB,
+                                                    self.zobristSeed, self.tablebasePath, self.cachePath,
+                                                    self.evalPath))
+            # Only a started process is kept, close() joins it
+            process.start()
+            self.ponderProcess = process
+        self.ponderStop.clear()
+        self.ponderConnection.send((board.root().fen(), [move.uci() for move in board.move_stack],
+                                    self.transpositionTable.deepEntries(SHARE_DEPTH)))
+        self.ponderMove = predicted
+        self.ponderHit = False
+        self.ponderFinished = False
+        self.ponderStats = []
+        self.ponderStartTime = (self.ponderStartTime + time.perf_counter() - start) / 2
+
+    def receivePonder(self, timeout):
+        # Handles one message of the ponder process, False if none came in time
+        if not self.ponderConnection.poll(timeout):
+            return False
+        kind, payload = self.ponderConnection.recv()
+        if kind == "iteration":
+            self.ponderStats.append(payload)
+        else:
+            # The search ended, and sent back what it learned
+            self.transpositionTable.merge(payload)
+            self.ponderFinished = True
+        return True
+
+    def stopPondering(self):
+        if self.ponderMove is None:
+            return
+        start = time.perf_counter()
+        self.ponderStop.set()
+        while not self.ponderFinished:
+            self.receivePonder(None)
+        self.ponderMove = None
+        self.ponderStopTime = (self.ponderStopTime + time.perf_counter() - start) / 2
+
+    def finishPondering(self, clock):
+        # Ponder hit: let the background search go on for the time this move
+        # would have had and play its result
+        start = time.perf_counter()
+        if clock is not None:
+            self.allocateTime(clock)
+        while not self.ponderFinished:
+            if clock is not None:
+                timeout = self.softDeadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+            else:
+                if self.ponderStats and self.ponderStats[-1]["depth"] >= self.maxDepth:
+                    break
+                timeout = None
+            if not self.receivePonder(timeout):
+                break
+        self.stopPondering()
+        if not self.ponderStats:
+            return self.searchMove(clock)
+
+        self.iterationStats = self.ponderStats
+        last = self.iterationStats[-1]
+        self.bestLine = [encodeMove(chess.Move.from_uci(move)) for move in last["pv"]]
+        counters = self.getCounters()
+        for name in counters:
+            setattr(self, name, sum(stats[name] for stats in self.iterationStats))
+        return self.reportMove(decodeMove(self.bestLine[0]), "ponder", start, last["score"])
+
+    def searchMove(self, clock):
+        start = time.perf_counter()
+        if self.book is not None:
+            bookMove = self.probeBook()
+            if bookMove is not None:
+                return self.reportMove(bookMove, "book", start)
+        if self.tablebases is not None:
+            tablebaseMove = self.probeTablebases()
+            if tablebaseMove is not None:
+                return self.reportMove(tablebaseMove, "tablebase", start)
+        if clock is not None:
+            self.allocateTime(clock)
+            evaluation, ret = self.findMoveRecursive(MAX_SEARCH_DEPTH, iterate=True)
+        else:
+            self.softDeadline = None
+            self.hardDeadline = None
+            evaluation, ret = self.findMoveRecursive(self.maxDepth, iterate=self.iterate)
+        return self.reportMove(ret, "search", start, evaluation)
+
+    def shouldStop(self):
+        if self.hardDeadline is not None and time.perf_counter() > self.hardDeadline:
+            return True
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            return True
+        return self.stopEvent is not None and self.stopEvent.is_set()
+
+    def resetCounters(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.hashHits = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+
+    def getCounters(self):
+        return {"nodes": self.nodes, "evaluations": self.evaluations, "hashHits": self.hashHits,
+                "betaCutoffs": self.betaCutoffs, "firstMoveCutoffs": self.firstMoveCutoffs}
+
+    def reportMove(self, move, source, start, evaluation=None):
+        seconds = time.perf_counter() - start
+        stats = {"move": move.uci(), "source": source, "score": evaluation, "seconds": seconds}
+        if source == "search" or source == "ponder":
+            stats.update(self.getCounters())
+            stats["depth"] = self.iterationStats[-1]["depth"] if self.iterationStats else 0
+            stats["pv"] = [decodeMove(move).uci() for move in self.bestLine]
+            stats["nps"] = self.nodes / seconds if seconds > 0 else 0.0
+            stats["firstMoveCutoffRate"] = self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+            stats["iterations"] = self.iterationStats
+        else:
+            # Book and tablebase moves come without a principal variation, the
+            # line of an earlier search must not be taken for theirs
+            self.bestLine = []
+        self.lastSearchStats = stats
+        if self.onMove is not None:
+            self.onMove(stats)
+        return move
         
-        return pieceSquareTables
         
+    def loadEvaluation(self, path):
+        # JSON file with pieceValues in pawns and middlegame and endgame tables
+        # laid out like the ones in createPieceSquareTables, keyed by piece name
+        with open(path) as file:
+            evaluation = json.load(file)
+        for name, value in evaluation["pieceValues"].items():
+            self.pieceValues[chess.PIECE_NAMES.index(name)] = value
+        tables = []
+        for phase in ("middlegame", "endgame"):
+            tables.append(flattenTables({chess.PIECE_NAMES.index(name): table
+                                              for name, table in evaluation[phase].items()}))
+        return tables
+
+    def allocateTime(self, clock):
+        start = time.perf_counter()
+        # A pondering bot also stops and starts its background search on
+        # every move, which takes time from the same clock
+        overhead = self.ponderStartTime + self.ponderStopTime if self.ponder else 0
+        available = max(0, clock.remaining - self.safetyMargin - overhead)
+        movesToGo = clock.movesToGo or self.expectedMovesToGo
+        target = max(0, available / movesToGo + 0.75 * clock.increment - overhead)
+        # Never plan to use more than what is left, and let a single move
+        # overrun its target only up to a fraction of the clock
+        hard = min(available, max(target * 4, clock.increment - overhead), available / 3 + clock.increment)
+        soft = min(target, hard)
+        self.softDeadline = start + soft
+        self.hardDeadline = start + hard
+
+    def createPosition(self):
+        materialValues = [0] * 16
+        for pieceType, value in self.pieceValues.items():
+            materialValues[8 + pieceType] = value
+            materialValues[pieceType] = -value
+        pieceKeys, sideKey, castlingKeys, enPassantKeys = zobristKeys(self.zobristSeed)
+        position = Position(pieceKeys, sideKey, castlingKeys, enPassantKeys,
+                            materialValues, self.middlegameTables, self.endgameTables)
+        position.setBoard(self.board)
+        return position
 
-    def initializeZobristHashNumbers(self):
-        # Implemented according to https://www.chessprogramming.org/Zobrist_Hashing
-        # And https://en.wikipedia.org/wiki/Zobrist_hashing
-        self.piecePositionHashes = []
-        for color in [chess.BLACK, chess.WHITE]:
-            self.piecePositionHashes.append([])
-            self.piecePositionHashes[color].append([])
-            for pieceType in self.pieceValues:
-                self.piecePositionHashes[color].append([])
-                for itr in range(64):
-                    self.piecePositionHashes[color][pieceType].append(random.randint(-sys.maxsize, sys.maxsize))
-        self.blackToMoveHash = random.randint(-sys.maxsize, sys.maxsize)
-
-
-        self.queenCastleHashes = [random.randint(-sys.maxsize, sys.maxsize), random.randint(-sys.maxsize, sys.maxsize)]
-        self.kingCastleHashes = [random.randint(-sys.maxsize, sys.maxsize), random.randint(-sys.maxsize, sys.maxsize)]
-        self.enPassantHashes = []
-        for itr in range(8):
-            self.enPassantHashes.append(random.randint(-sys.maxsize, sys.maxsize))
+    def probeBook(self):
+        # Picks one of the book moves at random, weighted by how good they
+        # were in the games the book was built from
+        candidates = []
+        weights = []
+        for move, weight in self.book.lookup(self.position.hash):
+            if self.position.isPseudoLegal(move) and self.position.makeMove(move):
+                self.position.unmakeMove()
+                candidates.append(move)
+                weights.append(weight)
+        if not candidates:
+            return None
+        return decodeMove(random.choices(candidates, weights)[0])
+
+    def probeTablebases(self):
+        # Plays the fastest win, else a draw, else the slowest loss
+        position = self.position
+        if position.castling or position.ep or self.tablebases.probe(position) is None:
+            return None
+        bestMove = None
+        bestRank = None
+        for move in position.generateMoves():
+            if not position.makeMove(move):
+                continue
+            value = None if position.ep else self.tablebases.probe(position)
+            position.unmakeMove()
+            if value is None:
+                return None
+            # The value is from the opponent's side after the move
+            if value == 0:
+                rank = 0
+            elif value % 2 == 1:
+                rank = 256 - value
+            else:
+                rank = value - 256
+            if bestRank is None or rank > bestRank:
+                bestMove = move
+                bestRank = rank
+        return None if bestMove is None else decodeMove(bestMove)
+
+    def tablebaseScore(self, value, depth):
+        if value == 0:
+            return 0
+        # Like getOutcome, but the mate is distance plies further away
+        distance = value - 1
+        score = 10000 + depth - distance
+        return -score if distance % 2 == 0 else score
 
     def moveValue(self, move):
-        if len(self.bestLine) > self.lineIDX and self.bestLine[self.lineIDX] == move:
-            #print("Found move!")
-            #print(self.lineIDX)
-            return 50000
-        #print("Did not find move!")
-        # Incorrectly valuates en passant captures as 0
-        val = 0
-        captureType = self.board.piece_type_at(move.to_square)
-        pieceType = self.board.piece_type_at(move.from_square)
-        if captureType is not None:
-            val += captureType
-            
-        '''if move.from_square in self.checkers:
-            return 50
-        '''
-        
+        # MVV-LVA: most valuable victim first, least valuable attacker breaks ties
+        squares = self.position.squares
+        captureType = squares[move >> 6 & 63] & 7
+        if not captureType and self.position.isCapture(move):
+            # En passant is the only capture that lands on an empty square
+            captureType = chess.PAWN
+        val = 10 * captureType - (squares[move & 63] & 7)
+        if move >> 12:
+            val += 10 * (move >> 12)
         return val
-    def calculateMaterialBalance(self):
-        blackTotal = 0
-        whiteTotal = 0
-        pieces = self.board.piece_map()
-        for piece in pieces.values():
-            if piece.color == chess.WHITE:
-                whiteTotal += self.pieceValues[piece.piece_type]
-            else:
-                blackTotal += self.pieceValues[piece.piece_type]
-        evaluation = whiteTotal - blackTotal
-        return evaluation
+
+    def sortMoves(self, moves):
+        # Sorts by moveValue in place without a key function: every entry
+        # becomes value << 16 | move, use entry & MOVE_MASK to get the move
+        position = self.position
+        squares = position.squares
+        for i in range(len(moves)):
+            move = moves[i]
+            captureType = squares[move >> 6 & 63] & 7
+            if not captureType and not move >> 12 and position.isCapture(move):
+                captureType = chess.PAWN
+            moves[i] = (10 * captureType - (squares[move & 63] & 7) + 10 * (move >> 12)) << 16 | move
+        moves.sort(reverse=True)
+
+    def orderedMoves(self, ply, hashMove):
+        # Moves are generated in stages so a cutoff in an early stage never
+        # pays for generating and sorting the later ones. The moves are only
+        # pseudo-legal, the caller has to check makeMove's result.
+        position = self.position
+        if hashMove and position.isPseudoLegal(hashMove):
+            yield hashMove
+        else:
+            hashMove = 0
+
+        state = self.state
+        noisy = state.noisy[ply]
+        noisy.clear()
+        position.generateNoisy(noisy)
+        self.sortMoves(noisy)
+        for move in noisy:
+            move &= MOVE_MASK
+            if move != hashMove:
+                yield move
+
+        killers = state.killers[ply]
+        for move in killers:
+            if move and move != hashMove and not move >> 12 and not position.isCapture(move) and \
+                    position.isPseudoLegal(move):
+                yield move
+
+        quiets = state.quiets[ply]
+        quiets.clear()
+        position.generateQuiets(quiets)
+        history = self.history
+        offset = 4096 * position.turn
+        for i in range(len(quiets)):
+            move = quiets[i]
+            quiets[i] = history[offset + (move & 4095)] << 16 | move
+        quiets.sort(reverse=True)
+        for move in quiets:
+            move &= MOVE_MASK
+            if move != hashMove and move != killers[0] and move != killers[1]:
+                yield move
+
+    def storeCutoff(self, move, ply, depth, searched):
+        self.betaCutoffs += 1
+        if searched == 1:
+            self.firstMoveCutoffs += 1
+        # Only quiet moves feed the killer and history tables, captures are
+        # already ordered well by MVV-LVA
+        if move >> 12 or self.position.isCapture(move):
+            return
+        killers = self.state.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[4096 * self.position.turn + (move & 4095)] += depth * depth
 
     def findMoveRecursive(self, depth, iterate=True):
+        if self.workers > 1:
+            results = self.searchParallel(depth, iterate)
+        else:
+            results = self.searchIterations(depth, iterate)
+
+        evaluation = None
+        if results:
+            _, evaluation, self.bestLine = results[-1]
+        else:
+            # Not even the first iteration finished in time
+            self.bestLine = [encodeMove(next(iter(self.board.legal_moves)))]
+        return evaluation, decodeMove(self.bestLine[0])
+
+    def searchIterations(self, depth, iterate):
+        # Returns (depth, evaluation, line) for every iteration that finished
         self.bestLine = []
-        self.skips = 0
+        self.resetCounters()
+        self.iterationStats = []
+        self.transpositionTable.newSearch()
+        self.state.clearKillers()
+        # Keep the history of earlier moves but let the new search dominate it
+        self.history = [value // 2 for value in self.history]
+        timed = self.hardDeadline is not None
         
         depths = [depth]
-        if iterate:
+        if timed:
+            # Start shallow so there is always a finished iteration to fall back on
+            depths = range(1, depth + 1)
+        elif iterate:
             depths = range(2, depth + 1)
-            
+
+        position = self.position
+        rootPly = position.stackTop
+        # The search works from the side to move's point of view, results
+        # are reported from white's
+        turnMultiplier = 1 if position.turn == chess.WHITE else -1
+        previousScore = None
+        results = []
         for itr in depths:
-            #print(f"Search at depth {itr}")
-            self.pastPositions = []
-            self.materialBalance = self.calculateMaterialBalance()
-            while(len(self.pastPositions) < depth + 1):
-                self.pastPositions.append({})
             self.currentDepth = itr
-            self.maxDepth = itr
-            evaluation, line = self.recurse(itr, 1 if self.board.turn == chess.WHITE else -1)
+            iterationStart = time.perf_counter()
+            countersBefore = self.getCounters()
+            try:
+                score, line = self.searchRoot(itr, previousScore)
+            except SearchTimeout:
+                # Unwind the partially searched line and keep the last full result
+                position.unwindTo(rootPly)
+                break
+            previousScore = score
+            score *= turnMultiplier
             self.bestLine = line
-        
-        print(f"Best line: {self.bestLine}.")
-        if len(self.bestLine) != depth:
-            print("Line is not full depth!")
-            #raise "AAAAAA"
-        return evaluation, self.bestLine[0]
+            results.append((itr, score, line))
+            now = time.perf_counter()
+            counters = {name: value - countersBefore[name] for name, value in self.getCounters().items()}
+            self.recordIteration(itr, score, line, counters, now - iterationStart)
+            if timed:
+                # A new iteration takes a multiple of the previous one, so do
+                # not start it if it would most likely run past the soft deadline
+                if now + 2 * (now - iterationStart) > self.softDeadline:
+                    break
+        self.saveToCache()
+        return results
+
+    def saveToCache(self):
+        if self.positionCache is not None:
+            self.positionCache.merge(self.transpositionTable.deepEntries(CACHE_MIN_DEPTH))
+
+    def recordIteration(self, depth, score, line, counters, seconds):
+        stats = {"depth": depth, "score": score, "pv": [decodeMove(move).uci() for move in line],
+                 "seconds": seconds}
+        stats.update(counters)
+        stats["firstMoveCutoffRate"] = counters["firstMoveCutoffs"] / counters["betaCutoffs"] \
+            if counters["betaCutoffs"] else 0.0
+        # Effective branching factor: how many times more nodes this depth
+        # took than the one before it
+        previous = self.iterationStats[-1]["nodes"] if self.iterationStats else 0
+        stats["branchingFactor"] = counters["nodes"] / previous if previous else None
+        self.iterationStats.append(stats)
+        if self.onIteration is not None:
+            self.onIteration(stats)
+
+    def searchParallel(self, depth, iterate):
+        position = self.position
+        # The table's move, mostly the best move of the previous search, is
+        # ordered first and so goes to the first worker
+        entry = self.transpositionTable.probe(position.hash)
+        rootMoves = []
+        for move in self.orderedMoves(0, entry[4] if entry is not None else 0):
+            if position.makeMove(move):
+                position.unmakeMove()
+                rootMoves.append(move)
+        workers = min(self.workers, len(rootMoves))
+        if workers < 2:
+            return self.searchIterations(depth, iterate)
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializeWorker,
+                                             (self.hashSizeMB, self.zobristSeed, self.tablebasePath, self.cachePath,
+                                              self.evalPath))
+        rootFen = self.board.root().fen()
+        moveStack = [move.uci() for move in self.board.move_stack]
+        budgets = None
+        if self.hardDeadline is not None:
+            now = time.perf_counter()
+            budgets = (self.softDeadline - now, self.hardDeadline - now)
+        # Deal the ordered moves out round robin so every worker gets some of
+        # the promising ones, then every worker deepens on its own share
+        jobs = [self.pool.apply_async(searchRootMoves, (rootFen, moveStack, rootMoves[i::workers], depth, iterate, budgets))
+                for i in range(workers)]
+        finished = [job.get() for job in jobs]
+        self.resetCounters()
+        self.iterationStats = []
+        self.transpositionTable.newSearch()
+        for _, _, counters, entries in finished:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+            self.transpositionTable.merge(entries)
+        if not finished[0][0]:
+            # Without a finished iteration of the first worker the first
+            # ordered move is played rather than the best of the other shares
+            return [(0, None, [rootMoves[0]])]
+        # Workers that finished no iteration did not look at their moves, which
+        # come later in the move order, and are left out
+        workerResults = [results for results, _, _, _ in finished if results]
+        workerStats = [stats for results, stats, _, _ in finished if results]
+
+        # Scores can only be compared between searches of the same depth, so
+        # keep the depths every worker finished and take the best move of each
+        turnMultiplier = 1 if position.turn == chess.WHITE else -1
+        commonDepth = min(results[-1][0] for results in workerResults)
+        combined = []
+        for results, stats in zip(zip(*workerResults), zip(*workerStats)):
+            if results[0][0] > commonDepth:
+                break
+            best = max(results, key=lambda result: result[1] * turnMultiplier)
+            combined.append(best)
+            # The workers search side by side, so their counts add up but
+            # the iteration takes as long as the slowest worker
+            counters = {name: sum(entry[name] for entry in stats) for name in self.getCounters()}
+            self.recordIteration(best[0], best[1], best[2], counters, max(entry["seconds"] for entry in stats))
+        return combined
 
     def getOutcome(self, depth):
-        outcome = self.board.outcome(claim_draw = False)
-        if outcome is None:
-            return None
-        if outcome.winner is None:
+        # Only valid when the side to move has no legal moves. Depth is added
+        # to incentivise quick checkmates.
+        if not self.position.inCheck():
             return 0
-        # Depth is added to incentivise quick checkmates
-        elif outcome.winner == chess.WHITE:
-            return 10000 + depth
         return -10000 - depth
 
     def verifyHash(self):
-        checkHash = self.getZobristHash()
-        if (checkHash != self.zobristHash):
-            print("Wrong hash!")
-            print(checkHash)
-            print(self.zobristHash)
-            print(move)
-            print(self.board)
-            self.zobristHash = checkHash
-
-    def recurse(self, depth, turnMultiplier, alpha=-math.inf, beta=math.inf, ignoreStuff=False, generateEvals=False):
+        # True when the incrementally updated hash matches a full recomputation
+        return self.getZobristHash() == self.position.hash
+
+    def searchRoot(self, depth, previousScore):
+        # Aspiration windows: search a narrow window around the score of the
+        # previous iteration and widen it on the side that failed
+        if previousScore is None or depth < 4 or abs(previousScore) >= MATE_THRESHOLD:
+            return self.recurse(depth, -math.inf, math.inf, 0, pvNode=True), self.state.line()
+        window = ASPIRATION_WINDOW
+        alpha = previousScore - window
+        beta = previousScore + window
+        while True:
+            score = self.recurse(depth, alpha, beta, 0, pvNode=True)
+            if score <= alpha:
+                window *= 4
+                alpha = score - window if window < 4 else -math.inf
+            elif score >= beta:
+                window *= 4
+                beta = score + window if window < 4 else math.inf
+            else:
+                return score, self.state.line()
+
+    def recurse(self, depth, alpha, beta, ply, allowNull=True, pvNode=False):
+        # Fail-soft negamax with principal variation search. Scores are from
+        # the side to move's point of view. The line behind the score is left
+        # in the triangular table of self.state. pvNode is set for nodes
+        # searched with a full window; the others get a zero window, which
+        # is told by this flag rather than by the float width of the window.
+        self.nodes += 1
+        if self.nodes & self.checkMask == 0 and self.shouldStop():
+            raise SearchTimeout()
+        position = self.position
+        state = self.state
+        pvLength = state.pvLength
+        pvLength[ply] = ply
+        isRoot = ply == 0
         # Check if the game has ended
+        if not isRoot and position.isDraw():
+            return 0
+        if self.tablebases is not None and not isRoot and not position.castling and not position.ep:
+            value = self.tablebases.probe(position)
+            if value is not None:
+                return self.tablebaseScore(value, depth)
         if depth < 1:
-            outcome = self.getOutcome(depth)
-            if outcome is not None:
-                return outcome, None
-            return self.evaluate(), None
-            
-        moves = list(self.board.legal_moves)
-        
-        if not moves:
-            outcome = self.getOutcome(depth)
-            # There should always be an outcome because no moves
-            return outcome, None
+            return self.quiesce(alpha, beta, ply)
 
-        bestEval = -math.inf * turnMultiplier
-        bestLine = None
+        hashMove = 0
+        entry = self.transpositionTable.probe(position.hash)
+        if entry is None and self.positionCache is not None and depth >= CACHE_MIN_DEPTH:
+            # Another process may have searched this position already
+            entry = self.positionCache.probe(position.hash)
+        if entry is not None:
+            hashMove = entry[4]
+            # The root always has to be searched to produce a move
+            if entry[1] >= depth and not isRoot:
+                score = entry[3]
+                bound = entry[2]
+                if bound == EXACT or \
+                        (bound == LOWER_BOUND and score >= beta) or \
+                        (bound == UPPER_BOUND and score <= alpha):
+                    self.hashHits += 1
+                    if hashMove:
+                        state.pv[ply][ply] = hashMove
+                        pvLength[ply] = ply + 1
+                    return score
 
+        inCheck = position.inCheck()
+        # Null move pruning: if passing still fails high, a real move will too.
+        # Not in check, and only with pieces left, where zugzwang is rare.
+        if allowNull and not pvNode and not isRoot and not inCheck and depth >= NULL_MOVE_MIN_DEPTH and \
+                position.hasPieces() and \
+                (self.evaluate() if position.turn else -self.evaluate()) >= beta:
+            reduction = 3 if depth >= 6 else 2
+            position.makeNullMove()
+            score = -self.recurse(depth - 1 - reduction, -beta, -beta + MIN_WINDOW, ply + 1, False)
+            position.unmakeNullMove()
+            if score >= beta:
+                # Mates found after passing are not real
+                return beta if score >= MATE_THRESHOLD else score
 
-        random.shuffle(moves)
-        # Killer move heuristic?
-        self.checkers = self.board.checkers()
-        self.lineIDX = self.maxDepth - depth
-        moves.sort(reverse=True, key=self.moveValue)
-        oldMaterialBalance = self.materialBalance
-        oldHash = self.zobristHash
+        alphaOrig = alpha
+        bestEval = -math.inf
+        bestMove = 0
 
+        if not hashMove and len(self.bestLine) > ply:
+            hashMove = self.bestLine[ply]
+
+        if isRoot and self.rootMoves is not None:
+            # Parallel workers only search their share of the root moves
+            moves = sorted(self.rootMoves, key=lambda move: move != hashMove)
+        else:
+            moves = self.orderedMoves(ply, hashMove)
+
+        killers = state.killers[ply]
+        line = state.pv[ply]
+        childLine = state.pv[ply + 1]
+        searched = 0
         for move in moves:
-            # Make move
-            if not ignoreStuff:
-                #self.zobristHash = self.getZobristHash()
-                # For exceptional cases: just generate a new one for now
-                self.moveWithHash(move)
-                '''evaluation2 = self.calculateMaterialBalance()
-                if self.materialBalance != evaluation2:
-                    print(f"Wrong eval in move generation! {self.materialBalance}, correct eval: {evaluation2}, move: {move}")
-                    self.materialBalance = evaluation2'''
+            quiet = depth >= LMR_MIN_DEPTH and not move >> 12 and not position.isCapture(move)
+            # Make move, skipping the pseudo-legal moves that leave the king in check
+            if not position.makeMove(move):
+                continue
+            searched += 1
+            if searched == 1:
+                score = -self.recurse(depth - 1, -beta, -alpha, ply + 1, pvNode=pvNode)
             else:
-                self.board.push(move)
+                # Late quiet moves are searched shallower, unless they are
+                # part of a check or a killer
+                reduction = 0
+                if quiet and searched > LMR_MOVES and not inCheck and move != killers[0] and \
+                        move != killers[1] and not position.inCheck():
+                    reduction = 1 if searched <= 8 or depth < 6 else 2
+                # Every move after the first one only has to prove it is not
+                # better than alpha, which a zero window does cheaply
+                score = -self.recurse(depth - 1 - reduction, -alpha - MIN_WINDOW, -alpha, ply + 1)
+                if score > alpha and reduction:
+                    score = -self.recurse(depth - 1, -alpha - MIN_WINDOW, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.recurse(depth - 1, -beta, -alpha, ply + 1, pvNode=pvNode)
+            position.unmakeMove()
 
-            if not ignoreStuff and self.zobristHash in self.pastPositions[depth]:
-                evaluation = self.pastPositions[depth][self.zobristHash]
-                self.skips += 1
-                retLine = None
-            else:
-                evaluation, retLine = self.recurse(depth - 1, -turnMultiplier, alpha, beta)
-                if not ignoreStuff:
-                    self.pastPositions[depth][self.zobristHash] = evaluation
-            self.board.pop()
-            self.materialBalance = oldMaterialBalance
-            if not ignoreStuff:
-                self.zobristHash = oldHash
-
-            if evaluation * turnMultiplier > bestEval * turnMultiplier:
-                bestEval = evaluation
-                bestLine = [move]
-                if retLine:
-                    bestLine.extend(retLine)
-
-                if (turnMultiplier == 1):
-                    alpha = max(alpha, bestEval)
-                    if bestEval >= beta:
-                        #break
-                        return 1000000, None
-
-                if (turnMultiplier == -1):
-                    beta = min(beta, bestEval)
-                    if bestEval <= alpha:
-                        #break
-                        return -1000000, None
-
-        return bestEval, bestLine
+            if score > bestEval:
+                bestEval = score
+                bestMove = move
+                # The line of this node is the move and then the child's line
+                end = pvLength[ply + 1]
+                line[ply] = move
+                line[ply + 1:end] = childLine[ply + 1:end]
+                pvLength[ply] = end
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        self.storeCutoff(move, ply, depth, searched)
+                        break
 
-    def evaluate(self):
-        # Assumes the game has not ended
-        #evaluation2 = self.calculateMaterialBalance()
-        evaluation = self.materialBalance
-        '''if evaluation != evaluation2:
-            print(f"Wrong eval! {evaluation}. True eval: {evaluation2}.")
-            self.materialBalance = evaluation2'''
-        '''opponentMoves = len([self.board.legal_moves])
-        self.board.push(chess.Move.null())
-        ownMoves = len([self.board.legal_moves])
-        if self.board.turn == chess.WHITE:
-            evaluation -= opponentMoves / 500
-            evaluation += ownMoves / 300
+        if not searched:
+            # There should always be an outcome because no moves
+            return self.getOutcome(depth)
+
+        if bestEval <= alphaOrig:
+            bound = UPPER_BOUND
+        elif bestEval >= beta:
+            bound = LOWER_BOUND
         else:
-            evaluation -= ownMoves / 300
-            evaluation += opponentMoves / 500
-        self.board.pop()'''
-            
-        pieces = self.board.piece_map()
-        for square, piece in pieces.items():
-            if piece.color == chess.WHITE:
-                evaluation += self.pieceSquareTables[piece.piece_type][chess.square_rank(square)][chess.square_file(square)]
-            else:
-                evaluation -= self.pieceSquareTables[piece.piece_type][-chess.square_rank(square)][chess.square_file(square)]
-        
-        
-        return evaluation
+            bound = EXACT
+        self.transpositionTable.store(position.hash, depth, bound, bestEval, bestMove)
 
-    def moveWithHash(self, move):
-        # Exceptional cases
-        if self.board.is_castling(move):
-            self.board.push(move)
-            self.zobristHash = self.getZobristHash()
-            return
-        if self.board.is_en_passant(move):
-            if self.board.piece_at(move.from_square).color == chess.WHITE:
-                self.materialBalance += 1
-            else:
-                self.materialBalance -= 1
-            self.board.push(move)
-            self.zobristHash = self.getZobristHash()
-            return
+        return bestEval
 
-        # Remove piece from starting square
-        square = move.from_square
-        piece = self.board.piece_at(square)
-        self.zobristHash ^= self.piecePositionHashes[piece.color][piece.piece_type][square]
-        # Remove piece from ending square
-        square = move.to_square
-        capturedPiece = self.board.piece_at(square)
-
-        if capturedPiece:
-            self.zobristHash ^= self.piecePositionHashes[capturedPiece.color][capturedPiece.piece_type][square]
-            if capturedPiece.color == chess.WHITE:
-                self.materialBalance -= self.pieceValues[capturedPiece.piece_type]
-            else:
-                self.materialBalance += self.pieceValues[capturedPiece.piece_type]
-        if move.promotion is not None:
-            if piece.color == chess.WHITE:
-                self.materialBalance += self.pieceValues[move.promotion] - 1
-            else:
-                self.materialBalance -= self.pieceValues[move.promotion] - 1
-
-        # Add piece to ending square
-        self.zobristHash ^= self.piecePositionHashes[piece.color][piece.piece_type][square]
-        # Change side to move
-        self.zobristHash ^= self.blackToMoveHash
-        # Remove old en passant flag
-        if self.board.ep_square:
-            self.zobristHash ^= self.enPassantHashes[chess.square_rank(self.board.ep_square)]
-        # Save old castling flags
-        self.oldQueenCastleWhite = self.board.has_queenside_castling_rights(chess.WHITE)
-        self.oldQueenCastleBlack = self.board.has_queenside_castling_rights(chess.BLACK)
-        self.oldKingCastleWhite = self.board.has_kingside_castling_rights(chess.WHITE)
-        self.oldKingCastleBlack = self.board.has_kingside_castling_rights(chess.BLACK)
-        # Make the move
-        self.board.push(move)
-        # Add new en passant flag
-        if self.board.ep_square:
-            self.zobristHash ^= self.enPassantHashes[chess.square_rank(self.board.ep_square)]
-        # Remove old castling flags
-        if not self.oldKingCastleBlack == self.board.has_kingside_castling_rights(chess.BLACK):
-            self.zobristHash ^= self.kingCastleHashes[chess.BLACK]
+    def quiesce(self, alpha, beta, ply):
+        # Resolves captures and promotions below the horizon so the static
+        # evaluation is never taken in the middle of an exchange
+        self.nodes += 1
+        if self.nodes & self.checkMask == 0 and self.shouldStop():
+            raise SearchTimeout()
+        position = self.position
+        if ply >= MAX_PLY - 1:
+            # Out of buffers, which only a very long exchange gets to
+            return self.evaluate() if position.turn else -self.evaluate()
+        moves = self.state.noisy[ply]
+        moves.clear()
+        inCheck = position.inCheck()
+        if inCheck:
+            # No standing pat in check, every evasion has to be tried
+            bestEval = -math.inf
+            position.generateNoisy(moves)
+            position.generateQuiets(moves)
+        else:
+            standPat = self.evaluate() if position.turn else -self.evaluate()
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            bestEval = standPat
+            position.generateNoisy(moves)
+        self.sortMoves(moves)
 
-        if not self.oldKingCastleWhite == self.board.has_kingside_castling_rights(chess.WHITE):
-            self.zobristHash ^= self.kingCastleHashes[chess.WHITE]
+        squares = position.squares
+        for move in moves:
+            move &= MOVE_MASK
+            if not inCheck:
+                promotion = move >> 12
+                if promotion:
+                    # Underpromotions are left to the main search
+                    if promotion != chess.QUEEN:
+                        continue
+                else:
+                    # Delta pruning, then skip captures that lose material
+                    if standPat + SEE_VALUES[squares[move >> 6 & 63] & 7 or chess.PAWN] + DELTA_MARGIN <= alpha:
+                        continue
+                    if position.see(move) < 0:
+                        continue
+            if not position.makeMove(move):
+                continue
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            position.unmakeMove()
+            if score > bestEval:
+                bestEval = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
 
-        if not self.oldQueenCastleBlack == self.board.has_queenside_castling_rights(chess.BLACK):
-            self.zobristHash ^= self.queenCastleHashes[chess.BLACK]
+        if bestEval == -math.inf:
+            # In check without a legal move
+            return self.getOutcome(0)
+        return bestEval
 
-        if not self.oldQueenCastleWhite == self.board.has_queenside_castling_rights(chess.WHITE):
-            self.zobristHash ^= self.queenCastleHashes[chess.WHITE]
+    def evaluate(self):
+        # Assumes the game has not ended
+        self.evaluations += 1
+        position = self.position
+        evaluation = position.material
 
+        # Taper between the middlegame and endgame tables by the material left
+        phase = position.phase if position.phase < TOTAL_PHASE else TOTAL_PHASE
+        evaluation += (position.middlegame * phase + position.endgame * (TOTAL_PHASE - phase)) / TOTAL_PHASE
+        
+        return evaluation
 
     def getZobristHash(self):
-        pieces = self.board.piece_map()
-        boardHash = 0
-
-        for square, piece in pieces.items():
-            boardHash ^= self.piecePositionHashes[piece.color][piece.piece_type][square]
+        # Full recomputation, the search keeps position.hash up to date incrementally
+        return self.position.computeHash()
 
-        if self.board.turn == chess.BLACK:
-            boardHash ^= self.blackToMoveHash
+# State of the processes in ChessBot's worker pool
+workerBot = None
 
-        if self.board.has_kingside_castling_rights(chess.BLACK):
-            boardHash ^= self.kingCastleHashes[chess.BLACK]
 
-        if self.board.has_kingside_castling_rights(chess.WHITE):
-            boardHash ^= self.kingCastleHashes[chess.WHITE]
+def initializeWorker(hashSizeMB, zobristSeed=ZOBRIST_SEED, tablebasePath=None, cachePath=None, evalPath=None):
+    global workerBot
+    workerBot = ChessBot(hashSizeMB=hashSizeMB, zobristSeed=zobristSeed, tablebasePath=tablebasePath,
+                         cachePath=cachePath, evalPath=evalPath)
+    workerBot.transpositionTable.shareDepth = SHARE_DEPTH
 
-        if self.board.has_queenside_castling_rights(chess.BLACK):
-            boardHash ^= self.queenCastleHashes[chess.BLACK]
 
-        if self.board.has_queenside_castling_rights(chess.WHITE):
-            boardHash ^= self.queenCastleHashes[chess.WHITE]
+def searchRootMoves(rootFen, moveStack, rootMoves, depth, iterate, budgets):
+    board = chess.Board(rootFen)
+    for move in moveStack:
+        board.push_uci(move)
+    workerBot.board = board
+    workerBot.position.setBoard(board)
+    if budgets is None:
+        workerBot.softDeadline = None
+        workerBot.hardDeadline = None
+    else:
+        start = time.perf_counter()
+        workerBot.softDeadline = start + budgets[0]
+        workerBot.hardDeadline = start + budgets[1]
+    workerBot.rootMoves = rootMoves
+    try:
+        results = workerBot.searchIterations(depth, iterate)
+        # The deeper part of the table goes back to the main process, so its
+        # next search does not start cold
+        return results, workerBot.iterationStats, workerBot.getCounters(), \
+            workerBot.transpositionTable.deepEntries(SHARE_DEPTH)
+    finally:
+        workerBot.rootMoves = None
 
-        if (not self.board.ep_square):
-            return boardHash
 
-        boardHash ^= self.enPassantHashes[chess.square_rank(self.board.ep_square)]
+def ponderWorker(connection, stopEvent, hashSizeMB, zobristSeed=ZOBRIST_SEED, tablebasePath=None, cachePath=None,
+                 evalPath=None):
+    # Runs in the ponder process of a ChessBot. Every job is a position to
+    # search until stopEvent is set, and every finished iteration is sent back.
+    bot = ChessBot(hashSizeMB=hashSizeMB, zobristSeed=zobristSeed, tablebasePath=tablebasePath, cachePath=cachePath,
+                   evalPath=evalPath)
+    bot.stopEvent = stopEvent
+    bot.checkMask = 127
+    bot.transpositionTable.shareDepth = SHARE_DEPTH
+    bot.onIteration = lambda stats: connection.send(("iteration", stats))
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        rootFen, moveStack, entries = job
+        board = chess.Board(rootFen)
+        for move in moveStack:
+            board.push_uci(move)
+        bot.board = board
+        bot.position.setBoard(board)
+        bot.transpositionTable.merge(entries)
+        if not stopEvent.is_set():
+            bot.searchIterations(MAX_SEARCH_DEPTH, True)
+        connection.send(("done", bot.transpositionTable.deepEntries(SHARE_DEPTH)))
 
-        return boardHash
 
 if __name__ == "__main__":
     bot = ChessBot(maxDepth=5)
-    #bot.verifyEvaluation(depth=4)
-    #bot()
-    '''for _ in range(100):
-        bot.pastPositions = []
-        while(len(bot.pastPositions) < 2):
-            bot.pastPositions.append({})
-        print(bot.recurse(1, -1, 3, math.inf))'''
     cProfile.runctx('bot()', globals(), locals())
+    stats = bot.lastSearchStats
+    print(f"{stats['move']} score {stats['score']} depth {stats['depth']} nodes {stats['nodes']} "
+          f"nps {stats['nps']:.0f} pv {' '.join(stats['pv'])}")